@@ -0,0 +1,87 @@
+import hashlib
+import time
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import get_redis_client
+from .config import settings
+from .metrics import counter
+from .models import RestaurantSettings
+
+
+assistant_answer_cache = counter("assistant_answer_cache_total", "Assistant answer cache lookups by result")
+
+
+def _version_key(restaurant_id: int) -> str:
+    return f"assistant:settings_ver:{restaurant_id}"
+
+
+def _index_key(restaurant_id: int) -> str:
+    return f"assistant:answers:{restaurant_id}"
+
+
+def _answer_key(restaurant_id: int, assistant_id: str, message: str, version: str) -> str:
+    digest = hashlib.sha256(f"{assistant_id}\x00{normalize_message(message)}\x00{version}".encode()).hexdigest()
+    return f"assistant:answer:{restaurant_id}:{digest}"
+
+
+def normalize_message(message: str) -> str:
+    return " ".join(message.lower().split()).strip(" ?!.")
+
+
+def settings_version(greeting_text: Optional[str], info_text: Optional[str]) -> str:
+    """Hash of the settings text the assistant answers from; answers are keyed on it."""
+    return hashlib.sha256(f"{greeting_text or ''}\x00{info_text or ''}".encode()).hexdigest()[:16]
+
+
+async def publish_settings_version(restaurant_id: int, greeting_text: Optional[str], info_text: Optional[str]) -> None:
+    """Record the new settings version and drop every answer cached for the restaurant."""
+    redis = get_redis_client()
+    keys = await redis.zrange(_index_key(restaurant_id), 0, -1)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(_version_key(restaurant_id), settings_version(greeting_text, info_text))
+        if keys:
+            pipe.delete(*keys)
+        pipe.delete(_index_key(restaurant_id))
+        await pipe.execute()
+
+
+async def drop_settings_version(restaurant_id: int) -> None:
+    """Forget the settings version; the next lookup derives it from the database, so older answers stop matching."""
+    await get_redis_client().delete(_version_key(restaurant_id))
+
+
+async def get_settings_version(db: AsyncSession, restaurant_id: int) -> str:
+    version = await get_redis_client().get(_version_key(restaurant_id))
+    if version is None:
+        row = await db.get(RestaurantSettings, restaurant_id)
+        version = settings_version(row.greeting_text if row else None, row.info_text if row else None)
+        await get_redis_client().set(_version_key(restaurant_id), version, nx=True)
+    return version
+
+
+async def get_answer(restaurant_id: int, assistant_id: str, message: str, version: str) -> Optional[str]:
+    answer = await get_redis_client().get(_answer_key(restaurant_id, assistant_id, message, version))
+    assistant_answer_cache.inc(result="hit" if answer is not None else "miss")
+    return answer
+
+
+async def store_answer(restaurant_id: int, assistant_id: str, message: str, version: str, answer: str) -> None:
+    if not answer:
+        return
+    key = _answer_key(restaurant_id, assistant_id, message, version)
+    index = _index_key(restaurant_id)
+    redis = get_redis_client()
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.set(key, answer, ex=settings.ASSISTANT_CACHE_TTL_SECONDS)
+        pipe.zadd(index, {key: time.time()})
+        pipe.expire(index, settings.ASSISTANT_CACHE_TTL_SECONDS)
+        pipe.zcard(index)
+        size = (await pipe.execute())[-1]
+    # keep at most ASSISTANT_CACHE_MAX_ENTRIES per restaurant, evicting the oldest
+    overflow = size - settings.ASSISTANT_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        evicted = await redis.zpopmin(index, overflow)
+        if evicted:
+            await redis.delete(*[k for k, _ in evicted])
@@ -1,3 +1,5 @@
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Any, Dict
 
@@ -5,11 +7,20 @@ import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from .cache import LocalCache, get_redis_client, subscribe
 from .config import settings
+from .metrics import counter
 
 
 security = HTTPBearer(auto_error=True)
 
+TOKEN_REVOKED_CHANNEL = "jwt:revoked"
+
+jwt_verifications = counter("jwt_verifications_total", "Bearer token checks by outcome (cached = signature check saved)")
+
+# sha256(token) -> verified payload
+_verified_tokens = LocalCache(settings.JWT_CACHE_MAX_ENTRIES, settings.JWT_CACHE_TTL_SECONDS)
+
 
 def create_access_token(subject: str, restaurant_id: int, expires_delta: timedelta | None = None) -> str:
     to_encode: Dict[str, Any] = {
@@ -33,8 +44,55 @@ def decode_token(token: str) -> Dict[str, Any]:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token") from e
 
 
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _revoked_key(digest: str) -> str:
+    return f"jwt:revoked:{digest}"
+
+
+async def verify_token(token: str) -> Dict[str, Any]:
+    """decode_token() with a bounded cache of already verified tokens."""
+    digest = _token_digest(token)
+    payload = _verified_tokens.get(digest)
+    if payload is not None:
+        if payload.get("exp", 0) > time.time():
+            jwt_verifications.inc(result="cached")
+            return payload
+        _verified_tokens.pop(digest)
+
+    try:
+        payload = decode_token(token)
+    except HTTPException:
+        jwt_verifications.inc(result="rejected")
+        raise
+    if settings.JWT_REVOCATION_ENABLED and await get_redis_client().exists(_revoked_key(digest)):
+        jwt_verifications.inc(result="rejected")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token revoked")
+    jwt_verifications.inc(result="verified")
+
+    remaining = payload.get("exp", 0) - time.time()
+    if remaining > 0:
+        _verified_tokens.set(digest, payload, ttl_seconds=remaining)
+    return payload
+
+
+async def revoke_token(token: str, payload: Dict[str, Any]) -> None:
+    """Add a token to the revocation list until it expires and evict it from every worker's cache."""
+    digest = _token_digest(token)
+    remaining = max(int(payload.get("exp", 0) - time.time()), 1)
+    _verified_tokens.pop(digest)
+    async with get_redis_client().pipeline(transaction=False) as pipe:
+        pipe.set(_revoked_key(digest), 1, ex=remaining)
+        pipe.publish(TOKEN_REVOKED_CHANNEL, digest)
+        await pipe.execute()
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
     token = credentials.credentials
-    payload = decode_token(token)
+    payload = await verify_token(token)
     return payload
 
+
+subscribe(TOKEN_REVOKED_CHANNEL, _verified_tokens.pop)
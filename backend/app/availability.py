@@ -0,0 +1,208 @@
+from dataclasses import dataclass
+from datetime import date
+from itertools import accumulate
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Select, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Booking, BookingTable, Restaurant
+
+
+MINUTES_PER_DAY = 24 * 60
+
+# Restaurant columns a Schedule is built from; select these instead of whole rows in bulk jobs
+SCHEDULE_COLUMNS = (
+    Restaurant.id,
+    Restaurant.default_table_count,
+    Restaurant.open_time,
+    Restaurant.close_time,
+    Restaurant.slot_minutes,
+    Restaurant.booking_minutes,
+)
+
+
+def parse_hhmm(value: str) -> int:
+    """Minutes since midnight for "HH:MM"; ValueError otherwise."""
+    hours, sep, minutes = value.strip().partition(":")
+    if not sep or not hours.isdigit() or not minutes.isdigit():
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    h, m = int(hours), int(minutes)
+    if h > 23 or m > 59:
+        raise ValueError(f"Invalid time {value!r}, expected HH:MM")
+    return h * 60 + m
+
+
+def format_hhmm(minute: int) -> str:
+    minute %= MINUTES_PER_DAY
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+@dataclass(frozen=True)
+class Schedule:
+    """Opening hours, slot grid and table inventory of one restaurant.
+
+    Minutes are counted from midnight of the booking date; a close_time at or
+    before open_time means the restaurant closes after midnight, so its late
+    slots have minutes past 1440.
+    """
+
+    tables: int
+    open_minute: int
+    close_minute: int
+    slot_minutes: int
+    booking_minutes: int
+
+    @classmethod
+    def of(cls, restaurant: Any) -> "Schedule":
+        """From a Restaurant or a row selected with SCHEDULE_COLUMNS."""
+        open_minute = parse_hhmm(restaurant.open_time)
+        close_minute = parse_hhmm(restaurant.close_time)
+        if close_minute <= open_minute:
+            close_minute += MINUTES_PER_DAY
+        return cls(
+            tables=restaurant.default_table_count,
+            open_minute=open_minute,
+            close_minute=close_minute,
+            slot_minutes=restaurant.slot_minutes,
+            booking_minutes=restaurant.booking_minutes,
+        )
+
+    def slot_starts(self) -> List[int]:
+        # the last slot starts one slot length before closing
+        return list(range(self.open_minute, self.close_minute - self.slot_minutes + 1, self.slot_minutes))
+
+    def slot_times(self) -> List[str]:
+        return [format_hhmm(m) for m in self.slot_starts()]
+
+    def _on_service_day(self, minute: int) -> int:
+        # times before opening belong to the night after the booking date
+        return minute + MINUTES_PER_DAY if minute < self.open_minute else minute
+
+    def slot_start(self, time_slot: str) -> Optional[int]:
+        """Minute a slot starts at, or None if it is not on this restaurant's grid."""
+        try:
+            minute = self._on_service_day(parse_hhmm(time_slot))
+        except ValueError:
+            return None
+        offset = minute - self.open_minute
+        if offset % self.slot_minutes or minute + self.slot_minutes > self.close_minute:
+            return None
+        return minute
+
+    def interval(self, time_slot: str, start_time: Optional[str], end_time: Optional[str]) -> Tuple[int, int]:
+        """[start, end) minutes a booking holds a table; ValueError on malformed times.
+
+        Without an end_time (or with one equal to the start) the booking lasts
+        booking_minutes; an end_time before the start runs past midnight and
+        is cut at closing time.
+        """
+        start = self._on_service_day(parse_hhmm(start_time or time_slot))
+        if end_time and parse_hhmm(end_time) != start % MINUTES_PER_DAY:
+            end = parse_hhmm(end_time) + (start // MINUTES_PER_DAY) * MINUTES_PER_DAY
+            if end <= start:
+                end += MINUTES_PER_DAY
+            if start < self.close_minute:
+                end = min(end, self.close_minute)
+        else:
+            end = start + self.booking_minutes
+        return start, end
+
+    def booking_interval(self, time_slot: str, start_time: Optional[str], end_time: Optional[str]) -> Tuple[int, int]:
+        """interval() of a new booking; ValueError unless it starts in opening hours, inside time_slot."""
+        slot = self.slot_start(time_slot)
+        if slot is None:
+            raise ValueError("Invalid time slot")
+        start, end = self.interval(time_slot, start_time, end_time)
+        if not self.open_minute <= start < self.close_minute:
+            raise ValueError(f"start_time {start_time} is outside opening hours")
+        if not slot <= start < slot + self.slot_minutes:
+            raise ValueError(f"start_time {start_time} is not within time slot {time_slot}")
+        return start, end
+
+
+class DayOccupancy:
+    """Tables in use per minute over one service day, built in one pass over its bookings.
+
+    Intervals are (start, end, tables); a booking at combined tables counts each of them.
+
+    Bookings are applied to a difference array and prefix-summed, so building
+    costs O(bookings + minutes); the per-slot figures and the fit check are
+    max() over list slices.
+    """
+
+    def __init__(self, schedule: Schedule, intervals: Iterable[Tuple[int, int, int]] = ()) -> None:
+        self.schedule = schedule
+        self.base = schedule.open_minute
+        intervals = list(intervals)
+        horizon = max(
+            [schedule.close_minute - self.base + schedule.booking_minutes]
+            + [end - self.base for _, end, _ in intervals]
+        )
+        diff = [0] * (horizon + 1)
+        for start, end, tables in intervals:
+            diff[max(start - self.base, 0)] += tables
+            diff[max(end - self.base, 0)] -= tables
+        self.minutes = list(accumulate(diff[:-1]))
+
+    def _extend(self, end: int) -> None:
+        missing = end - self.base - len(self.minutes)
+        if missing > 0:
+            self.minutes.extend([0] * missing)
+
+    def peak(self, start: int, end: int) -> int:
+        lo, hi = max(start - self.base, 0), max(end - self.base, 0)
+        return max(self.minutes[lo:hi], default=0)
+
+    def fits(self, start: int, end: int, tables: int = 1) -> bool:
+        return self.peak(start, end) + tables <= self.schedule.tables
+
+    def add(self, start: int, end: int, tables: int = 1) -> None:
+        self._extend(end)
+        lo, hi = max(start - self.base, 0), max(end - self.base, 0)
+        self.minutes[lo:hi] = [n + tables for n in self.minutes[lo:hi]]
+
+    def slot_booked(self) -> Dict[str, int]:
+        """Per slot, tables unavailable to a booking of the default length starting there."""
+        length = self.schedule.booking_minutes
+        return {format_hhmm(m): self.peak(m, m + length) for m in self.schedule.slot_starts()}
+
+    def slot_usage(self) -> Dict[str, int]:
+        """Per slot, table-minutes in use between its start and the next slot."""
+        length = self.schedule.slot_minutes
+        return {format_hhmm(m): sum(self.minutes[m - self.base:m - self.base + length]) for m in self.schedule.slot_starts()}
+
+
+async def load_occupancy(
+    db: AsyncSession,
+    restaurant_id: int,
+    schedule: Schedule,
+    days: Iterable[date],
+) -> Dict[date, DayOccupancy]:
+    """Occupancy of several days of one restaurant from a single query over their bookings."""
+    days = list(days)
+    if not days:
+        return {}
+    # tables per booking; unseated bookings still hold one
+    seated = (
+        select(func.count(BookingTable.table_id))
+        .where(BookingTable.booking_id == Booking.id)
+        .scalar_subquery()
+    )
+    stmt: Select = (
+        select(Booking.date, Booking.time_slot, Booking.start_time, Booking.end_time, seated)
+        .where(Booking.restaurant_id == restaurant_id)
+        .where(Booking.date.in_(days))
+    )
+    intervals: Dict[date, List[Tuple[int, int, int]]] = {d: [] for d in days}
+    for day, time_slot, start_time, end_time, tables in (await db.execute(stmt)).all():
+        try:
+            interval = schedule.interval(time_slot, start_time, end_time)
+        except ValueError:
+            # rows written before times were validated: fall back to the slot itself
+            try:
+                interval = schedule.interval(time_slot, None, None)
+            except ValueError:
+                continue
+        intervals[day].append((*interval, max(tables, 1)))
+    return {d: DayOccupancy(schedule, intervals[d]) for d in days}
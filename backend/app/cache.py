@@ -1,31 +1,598 @@
+import asyncio
+import hashlib
 import json
-from typing import Any, Optional
+import logging
+import math
+import random
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional
 
 from redis.asyncio import Redis
+from redis.commands.core import AsyncScript
+from redis.exceptions import RedisError
 
 from .config import settings
+from .db import AsyncSessionLocal
+from .instrumentation import TimedRedis
+from .metrics import callback_gauge, counter
+from .schemas import SlotsResponse
+from .slots import build_slots, load_day_counts
+
+
+logger = logging.getLogger(__name__)
+
+SLOTS_INVALIDATE_CHANNEL = "slots:invalidate"
+
+slots_cache_requests = counter("slots_cache_requests_total", "Slot cache lookups by tier and result")
+
+
+def _slots_hit_ratio():
+    for tier in ("l1", "redis"):
+        hits = slots_cache_requests.value(tier=tier, result="hit")
+        total = hits + slots_cache_requests.value(tier=tier, result="miss")
+        if total:
+            yield {"tier": tier}, hits / total
+
+
+callback_gauge("slots_cache_hit_ratio", "Share of slot cache lookups answered by each tier since start", _slots_hit_ratio)
+
+# Identifies this worker on the invalidation channel so it can ignore its own messages
+WORKER_ID = uuid.uuid4().hex
+
+_redis: Optional[Redis] = None
+_listener: Optional[asyncio.Task] = None
+_handlers: Dict[str, Callable[[str], Awaitable[None] | None]] = {}
+_release_lease_script: Optional[AsyncScript] = None
+# Slot recomputations in progress on this worker, by cache key
+_inflight: "dict[str, asyncio.Task]" = {}
+# Every LocalCache, so all of them can be flushed when pub/sub invalidations may have been missed
+_local_caches: "list[LocalCache]" = []
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        _local_caches.append(self)
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+slots_l1 = LocalCache(settings.SLOTS_L1_MAX_ENTRIES, settings.SLOTS_L1_TTL_SECONDS)
 
 
 def get_redis_client() -> Redis:
-    return Redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+    global _redis
+    if _redis is None:
+        _redis = TimedRedis.from_url(
+            settings.REDIS_URL,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            health_check_interval=30,
+        )
+    return _redis
 
 
-async def get_cached_slots(restaurant_id: int, date_str: str) -> Optional[list[dict[str, Any]]]:
-    redis = get_redis_client()
-    key = f"slots:{restaurant_id}:{date_str}"
-    data = await redis.get(key)
-    await redis.aclose()
-    if data:
+def subscribe(channel: str, handler: Callable[[str], Awaitable[None] | None]) -> None:
+    """Register a handler for a pub/sub channel; must be called before init_cache()."""
+    _handlers[channel] = handler
+
+
+async def _listen() -> None:
+    while True:
+        pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
         try:
-            return json.loads(data)
-        except Exception:
-            return None
+            await pubsub.subscribe(*_handlers.keys())
+            async for message in pubsub.listen():
+                handler = _handlers.get(message["channel"])
+                if handler is None:
+                    continue
+                result = handler(message["data"])
+                if asyncio.iscoroutine(result):
+                    await result
+        except asyncio.CancelledError:
+            raise
+        except (RedisError, OSError) as e:
+            # Invalidations may have been missed while disconnected
+            logger.warning("cache invalidation listener disconnected: %s", e)
+            for local_cache in _local_caches:
+                local_cache.clear()
+            await asyncio.sleep(1.0)
+        finally:
+            await pubsub.aclose()
+
+
+async def init_cache() -> None:
+    global _listener
+    get_redis_client()
+    if _handlers and _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+async def close_cache() -> None:
+    global _redis, _listener
+    for task in list(_inflight.values()):
+        task.cancel()
+    if _listener is not None:
+        _listener.cancel()
+        try:
+            await _listener
+        except asyncio.CancelledError:
+            pass
+        _listener = None
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+# Booked tables per slot as a JSON object in schedule order (slot grids differ per restaurant)
+BOOKED_FIELD = "__booked__"
+TABLES_FIELD = "__tables__"
+# Changes on every write to the day; served as the ETag of the slots response
+VERSION_FIELD = "__v__"
+# Unix time the day turns stale, and how long computing it took (for XFetch)
+FRESH_FIELD = "__fresh__"
+DELTA_FIELD = "__delta__"
+
+_RELEASE_LEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CachedSlots(NamedTuple):
+    version: Optional[str]
+    slots: list[dict[str, Any]]
+    # SlotsResponse JSON, validated and rendered once per version so hits skip the model layer
+    body: bytes
+    fresh_until: float = 0.0
+    delta: float = 0.0
+
+
+def new_version() -> str:
+    return secrets.token_hex(8)
+
+
+def _slots_key(restaurant_id: int, date_str: str) -> str:
+    return f"slotmap:{restaurant_id}:{date_str}"
+
+
+def _parse_hash(data: dict[str, str]) -> Optional[tuple[dict[str, int], int, Optional[str], float, float]]:
+    if not data or TABLES_FIELD not in data or BOOKED_FIELD not in data:
+        return None
+    try:
+        table_count = int(data[TABLES_FIELD])
+        counts = {t: int(v) for t, v in json.loads(data[BOOKED_FIELD]).items()}
+        # entries written without freshness metadata count as stale
+        fresh_until = float(data.get(FRESH_FIELD, 0))
+        delta = float(data.get(DELTA_FIELD, 0))
+    except ValueError:
+        return None
+    return counts, table_count, data.get(VERSION_FIELD), fresh_until, delta
+
+
+def _cached_slots(
+    restaurant_id: int,
+    date_str: str,
+    version: Optional[str],
+    counts: dict[str, int],
+    table_count: int,
+    fresh_until: float = 0.0,
+    delta: float = 0.0,
+) -> CachedSlots:
+    slots = build_slots(counts, table_count)
+    body = SlotsResponse(restaurant_id=restaurant_id, date=date_str, slots=slots).model_dump_json().encode()
+    return CachedSlots(version, slots, body, fresh_until, delta)
+
+
+def _slots_from_hash(restaurant_id: int, date_str: str, data: dict[str, str]) -> Optional[CachedSlots]:
+    parsed = _parse_hash(data)
+    if parsed is None:
+        return None
+    counts, table_count, version, fresh_until, delta = parsed
+    return _cached_slots(restaurant_id, date_str, version, counts, table_count, fresh_until, delta)
+
+
+def _hash_mapping(counts: dict[str, int], cached: CachedSlots, table_count: int) -> dict[str, Any]:
+    return {
+        BOOKED_FIELD: json.dumps(counts),
+        TABLES_FIELD: table_count,
+        VERSION_FIELD: cached.version,
+        FRESH_FIELD: cached.fresh_until,
+        DELTA_FIELD: cached.delta,
+    }
+
+
+def needs_refresh(cached: CachedSlots) -> bool:
+    """Stale, or picked for early refresh by XFetch: the longer a day takes to
+    compute, the earlier before its soft expiry a reader may start recomputing it."""
+    early = -cached.delta * settings.SLOTS_XFETCH_BETA * math.log(1.0 - random.random())
+    return time.time() + early >= cached.fresh_until
+
+
+async def get_cached_slots(restaurant_id: int, date_str: str) -> Optional[CachedSlots]:
+    key = _slots_key(restaurant_id, date_str)
+    local = slots_l1.get(key)
+    if local is not None:
+        slots_cache_requests.inc(tier="l1", result="hit")
+        return local
+    slots_cache_requests.inc(tier="l1", result="miss")
+
+    cached = _slots_from_hash(restaurant_id, date_str, await get_redis_client().hgetall(key))
+    if cached is not None:
+        slots_cache_requests.inc(tier="redis", result="hit")
+        slots_l1.set(key, cached)
+        return cached
+    slots_cache_requests.inc(tier="redis", result="miss")
     return None
 
 
-async def set_cached_slots(restaurant_id: int, date_str: str, slots: list[dict[str, Any]], ttl_seconds: int = 3600) -> None:
+async def set_cached_slots(
+    restaurant_id: int,
+    date_str: str,
+    counts: dict[str, int],
+    table_count: int,
+    ttl_seconds: Optional[int] = None,
+    compute_seconds: float = 0.0,
+    broadcast: bool = False,
+) -> CachedSlots:
+    written = await set_cached_slots_many(
+        restaurant_id, {date_str: counts}, table_count, ttl_seconds, broadcast, compute_seconds
+    )
+    return written[date_str]
+
+
+async def write_through_slots(restaurant_id: int, day: date, counts: dict[str, int], table_count: int) -> None:
+    """Cache a day a writer just changed, for every worker; a Redis failure does not fail the write."""
+    try:
+        await set_cached_slots(restaurant_id, day.isoformat(), counts, table_count, broadcast=True)
+    except RedisError as e:
+        # the reconciliation job repairs the cached day
+        logger.warning("slot cache update failed for %s/%s: %s", restaurant_id, day, e)
+
+
+async def get_cached_slots_many(restaurant_id: int, date_strs: list[str]) -> dict[str, Optional[CachedSlots]]:
+    """Look up several days at once: L1 first, then one pipelined HGETALL round trip for the rest."""
+    found: dict[str, Optional[CachedSlots]] = {}
+    remote: list[str] = []
+    for date_str in date_strs:
+        local = slots_l1.get(_slots_key(restaurant_id, date_str))
+        if local is not None:
+            slots_cache_requests.inc(tier="l1", result="hit")
+            found[date_str] = local
+        else:
+            slots_cache_requests.inc(tier="l1", result="miss")
+            remote.append(date_str)
+    if not remote:
+        return found
+
+    async with get_redis_client().pipeline(transaction=False) as pipe:
+        for date_str in remote:
+            pipe.hgetall(_slots_key(restaurant_id, date_str))
+        values = await pipe.execute()
+    for date_str, data in zip(remote, values):
+        cached = _slots_from_hash(restaurant_id, date_str, data)
+        if cached is not None:
+            slots_cache_requests.inc(tier="redis", result="hit")
+            slots_l1.set(_slots_key(restaurant_id, date_str), cached)
+        else:
+            slots_cache_requests.inc(tier="redis", result="miss")
+        found[date_str] = cached
+    return found
+
+
+async def set_cached_slots_many(
+    restaurant_id: int,
+    counts_by_date: dict[str, dict[str, int]],
+    table_count: int,
+    ttl_seconds: Optional[int] = None,
+    broadcast: bool = False,
+    compute_seconds: float = 0.0,
+) -> dict[str, CachedSlots]:
+    """Write whole days in one round trip, each with a fresh version; broadcast=True also drops other workers' L1 copies.
+
+    Days are fresh for ttl_seconds and kept SLOTS_STALE_SECONDS longer so
+    readers can be served stale while a refresh runs.
+    """
+    ttl = settings.SLOTS_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+    fresh_until = time.time() + ttl
+    written = {
+        d: _cached_slots(restaurant_id, d, new_version(), c, table_count, fresh_until, compute_seconds)
+        for d, c in counts_by_date.items()
+    }
+    if not written:
+        return written
+    async with get_redis_client().pipeline(transaction=True) as pipe:
+        for date_str, counts in counts_by_date.items():
+            key = _slots_key(restaurant_id, date_str)
+            pipe.delete(key)
+            pipe.hset(key, mapping=_hash_mapping(counts, written[date_str], table_count))
+            pipe.expire(key, ttl + settings.SLOTS_STALE_SECONDS)
+            if broadcast:
+                pipe.publish(SLOTS_INVALIDATE_CHANNEL, f"{WORKER_ID}|{key}")
+        await pipe.execute()
+    for date_str, cached in written.items():
+        slots_l1.set(_slots_key(restaurant_id, date_str), cached)
+    return written
+
+
+async def drop_cached_slots(restaurant_id: int, date_strs: list[str]) -> None:
+    """Delete cached days everywhere so the next read recomputes them."""
+    if not date_strs:
+        return
+    keys = [_slots_key(restaurant_id, d) for d in date_strs]
+    async with get_redis_client().pipeline(transaction=False) as pipe:
+        pipe.delete(*keys)
+        for key in keys:
+            slots_l1.pop(key)
+            pipe.publish(SLOTS_INVALIDATE_CHANNEL, f"{WORKER_ID}|{key}")
+        await pipe.execute()
+
+
+async def drop_restaurant_slots(restaurant_id: int) -> None:
+    """Drop every cached day of a restaurant, e.g. after its schedule changed."""
+    prefix = _slots_key(restaurant_id, "")
+    date_strs = [key[len(prefix):] async for key in get_redis_client().scan_iter(match=f"{prefix}*", count=500)]
+    await drop_cached_slots(restaurant_id, date_strs)
+
+
+async def peek_cached_counts(restaurant_id: int, date_strs: list[str]) -> dict[str, Optional[tuple[dict[str, int], int]]]:
+    """Raw (counts, table_count) per cached day straight from Redis, bypassing L1 and metrics."""
+    async with get_redis_client().pipeline(transaction=False) as pipe:
+        for date_str in date_strs:
+            pipe.hgetall(_slots_key(restaurant_id, date_str))
+        values = await pipe.execute()
+    found: dict[str, Optional[tuple[dict[str, int], int]]] = {}
+    for date_str, data in zip(date_strs, values):
+        parsed = _parse_hash(data)
+        found[date_str] = parsed[:2] if parsed is not None else None
+    return found
+
+
+def _settings_key(restaurant_id: int) -> str:
+    return f"restaurant_settings:{restaurant_id}"
+
+
+def settings_etag(data: dict[str, Any]) -> str:
+    """Content hash of a settings payload, so any worker derives the same tag."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16]
+
+
+async def get_cached_settings(restaurant_id: int) -> Optional[tuple[str, str]]:
+    """(etag, JSON body) of the restaurant settings as last written, or None (also when Redis is unavailable)."""
+    try:
+        raw = await get_redis_client().get(_settings_key(restaurant_id))
+    except RedisError as e:
+        logger.warning("settings cache read failed: %s", e)
+        return None
+    if raw is None:
+        return None
+    etag, _, body = raw.partition("|")
+    return etag, body
+
+
+async def drop_cached_settings(restaurant_id: int) -> None:
+    await get_redis_client().delete(_settings_key(restaurant_id))
+
+
+async def set_cached_settings(
+    restaurant_id: int,
+    data: dict[str, Any],
+    ttl_seconds: int = 3600,
+    only_if_missing: bool = False,
+) -> tuple[str, str]:
+    """Store the settings body; reads fill with only_if_missing=True so they never overwrite a newer write."""
+    etag = settings_etag(data)
+    body = json.dumps(data)
+    await get_redis_client().set(_settings_key(restaurant_id), f"{etag}|{body}", ex=ttl_seconds, nx=only_if_missing)
+    return etag, body
+
+
+def _analytics_key(restaurant_id: int, report: str) -> str:
+    return f"analytics:{restaurant_id}:{report}"
+
+
+async def get_cached_report(restaurant_id: int, report: str) -> Optional[str]:
+    """JSON body of an analytics report computed within ANALYTICS_CACHE_TTL_SECONDS, or None."""
+    try:
+        return await get_redis_client().get(_analytics_key(restaurant_id, report))
+    except RedisError as e:
+        logger.warning("analytics cache read failed: %s", e)
+        return None
+
+
+async def set_cached_report(restaurant_id: int, report: str, body: str) -> None:
+    try:
+        await get_redis_client().set(_analytics_key(restaurant_id, report), body, ex=settings.ANALYTICS_CACHE_TTL_SECONDS)
+    except RedisError as e:
+        logger.warning("analytics cache write failed: %s", e)
+
+
+async def expiring_cached_days(restaurant_id: int, date_strs: list[str], within_seconds: float) -> list[str]:
+    """Days that are not cached or turn stale within the given number of seconds."""
+    async with get_redis_client().pipeline(transaction=False) as pipe:
+        for date_str in date_strs:
+            pipe.hget(_slots_key(restaurant_id, date_str), FRESH_FIELD)
+        values = await pipe.execute()
+    horizon = time.time() + within_seconds
+    return [d for d, fresh_until in zip(date_strs, values) if fresh_until is None or float(fresh_until) < horizon]
+
+
+def _pin_key(restaurant_id: int) -> str:
+    return f"dbpin:{restaurant_id}"
+
+
+# restaurant id -> monotonic time its pin expires, for writes made by this worker
+_local_pins: Dict[int, float] = {}
+
+
+async def pin_to_primary(restaurant_id: int) -> None:
+    """After a write, send this restaurant's reads to the primary until replicas have caught up."""
+    if not settings.DB_READ_URLS or settings.READ_YOUR_WRITES_SECONDS <= 0:
+        return
+    _local_pins[restaurant_id] = time.monotonic() + settings.READ_YOUR_WRITES_SECONDS
+    try:
+        await get_redis_client().set(
+            _pin_key(restaurant_id), "1", px=int(settings.READ_YOUR_WRITES_SECONDS * 1000)
+        )
+    except RedisError as e:
+        logger.warning("could not pin restaurant %s to the primary: %s", restaurant_id, e)
+
+
+async def is_pinned_to_primary(restaurant_id: int) -> bool:
+    if _local_pins.get(restaurant_id, 0.0) > time.monotonic():
+        return True
+    _local_pins.pop(restaurant_id, None)
+    try:
+        return bool(await get_redis_client().exists(_pin_key(restaurant_id)))
+    except RedisError:
+        # unknown, so stay consistent
+        return True
+
+
+async def acquire_lease(name: str, ttl_seconds: float) -> bool:
+    """Best-effort cross-worker lease so periodic jobs run on one worker per round."""
+    return bool(await get_redis_client().set(f"lease:{name}", WORKER_ID, nx=True, px=int(ttl_seconds * 1000)))
+
+
+async def release_lease(name: str) -> None:
+    """Give a lease back early, only if this worker still holds it."""
+    global _release_lease_script
     redis = get_redis_client()
-    key = f"slots:{restaurant_id}:{date_str}"
-    await redis.set(key, json.dumps(slots), ex=ttl_seconds)
-    await redis.aclose()
+    if _release_lease_script is None or _release_lease_script.registered_client is not redis:
+        _release_lease_script = redis.register_script(_RELEASE_LEASE_LUA)
+    await _release_lease_script(keys=[f"lease:{name}"], args=[WORKER_ID])
+
+
+async def _load_slots(
+    restaurant_id: int,
+    date_str: str,
+    day: date,
+    wait: bool,
+    seen: Optional[CachedSlots] = None,
+) -> Optional[CachedSlots]:
+    """Recompute one day under a cross-worker lease and write it to the cache.
+
+    Without the lease, wait=True polls Redis for the holder's result (up to
+    SLOTS_LOCK_TTL_SECONDS, then computes anyway) and wait=False gives up,
+    returning None. seen is the stale copy that prompted a refresh.
+    """
+    lease = f"slots:{restaurant_id}:{date_str}"
+    key = _slots_key(restaurant_id, date_str)
+    owned = await acquire_lease(lease, settings.SLOTS_LOCK_TTL_SECONDS)
+    if not owned:
+        if not wait:
+            return None
+        deadline = time.monotonic() + settings.SLOTS_LOCK_TTL_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            cached = _slots_from_hash(restaurant_id, date_str, await get_redis_client().hgetall(key))
+            if cached is not None and cached.fresh_until > time.time():
+                slots_l1.set(key, cached)
+                return cached
+    try:
+        # another worker may have refreshed the day since our copy was read; L1 copies are not told
+        current = _slots_from_hash(restaurant_id, date_str, await get_redis_client().hgetall(key))
+        if current is not None and current.fresh_until > time.time() and (seen is None or current.version != seen.version):
+            slots_l1.set(key, current)
+            return current
+        started = time.monotonic()
+        async with AsyncSessionLocal() as db:
+            loaded = await load_day_counts(db, restaurant_id, day)
+        if loaded is None:
+            return None
+        counts, table_count = loaded
+        return await set_cached_slots(
+            restaurant_id, date_str, counts, table_count, compute_seconds=time.monotonic() - started
+        )
+    finally:
+        if owned:
+            await release_lease(lease)
+
+
+def refresh_slots_in_background(restaurant_id: int, date_str: str, day: date, seen: CachedSlots) -> None:
+    """Recompute a stale day off the request path; at most one refresh per key per worker."""
+    key = _slots_key(restaurant_id, date_str)
+    if key in _inflight:
+        return
+    task = asyncio.create_task(_load_slots(restaurant_id, date_str, day, wait=False, seen=seen))
+    _inflight[key] = task
+
+    def _done(t: asyncio.Task) -> None:
+        _inflight.pop(key, None)
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("background slot refresh for %s failed: %s", key, t.exception())
+
+    task.add_done_callback(_done)
+
+
+async def get_or_load_slots(restaurant_id: int, date_str: str, day: date) -> Optional[CachedSlots]:
+    """Cached day, recomputing at most once per key per worker (and per cluster, via the lease).
+
+    Stale or early-refresh entries are returned as is while a background task
+    recomputes them; only a real miss waits for the database. None means the
+    restaurant does not exist.
+    """
+    cached = await get_cached_slots(restaurant_id, date_str)
+    if cached is not None:
+        if needs_refresh(cached):
+            refresh_slots_in_background(restaurant_id, date_str, day, cached)
+        return cached
+
+    key = _slots_key(restaurant_id, date_str)
+    while True:
+        task = _inflight.get(key)
+        leader = task is None or task.done()
+        if leader:
+            # a task, not the caller's coroutine: followers keep waiting if the first request is cancelled
+            task = asyncio.create_task(_load_slots(restaurant_id, date_str, day, wait=True))
+            _inflight[key] = task
+            task.add_done_callback(lambda _: _inflight.pop(key, None))
+        cached = await asyncio.shield(task)
+        # None from someone else's task may be a background refresh that yielded to another worker
+        if cached is not None or leader:
+            return cached
+
+
+def _on_slots_invalidated(data: str) -> None:
+    sender, _, key = data.partition("|")
+    if sender != WORKER_ID:
+        slots_l1.pop(key)
+
 
+subscribe(SLOTS_INVALIDATE_CHANNEL, _on_slots_invalidated)
@@ -4,29 +4,101 @@ from typing import List
 
 class Settings:
     DB_URL: str = os.getenv("DB_URL", "postgresql+asyncpg://crm_user:crm_password@db:5432/crm_db")
+    # Comma-separated read replica URLs for read-only endpoints; empty sends everything to DB_URL
+    DB_READ_URLS: List[str] = [u.strip() for u in os.getenv("DB_READ_URLS", "").split(",") if u.strip()]
+    # Connection pool per worker: primary, and each replica
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", "5"))
+    DB_READ_MAX_OVERFLOW: int = int(os.getenv("DB_READ_MAX_OVERFLOW", "10"))
+    # Reads of a restaurant go to the primary this long after a write to it (replica lag budget)
+    READ_YOUR_WRITES_SECONDS: float = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+    # An unreachable replica is skipped this long before it is tried again
+    DB_REPLICA_RETRY_SECONDS: float = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
     JWT_SECRET: str = os.getenv("JWT_SECRET", "supersecretjwt")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
+    # Verified-token cache per worker; entries never outlive the token's exp
+    JWT_CACHE_MAX_ENTRIES: int = int(os.getenv("JWT_CACHE_MAX_ENTRIES", "4096"))
+    JWT_CACHE_TTL_SECONDS: float = float(os.getenv("JWT_CACHE_TTL_SECONDS", "300"))
+    # Check a Redis revocation list (POST /auth/logout) when verifying tokens
+    JWT_REVOCATION_ENABLED: bool = os.getenv("JWT_REVOCATION_ENABLED", "false").lower() in ("1", "true", "yes")
     ADMIN_USERNAME: str = os.getenv("ADMIN_USERNAME", "admin")
     ADMIN_PASSWORD: str = os.getenv("ADMIN_PASSWORD", "password123")
     FRONTEND_ORIGIN: str = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    # Shared upstream client for the assistants proxy
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_MAX_KEEPALIVE: int = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+    OPENAI_KEEPALIVE_EXPIRY_SECONDS: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    OPENAI_HTTP2: bool = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes")
+    OPENAI_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+    OPENAI_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+    OPENAI_RETRY_BACKOFF_SECONDS: float = float(os.getenv("OPENAI_RETRY_BACKOFF_SECONDS", "0.5"))
+    OPENAI_RETRY_MAX_DELAY_SECONDS: float = float(os.getenv("OPENAI_RETRY_MAX_DELAY_SECONDS", "8"))
+    # Admission control and shared run polling for /assistants
+    ASSISTANT_MAX_ACTIVE_RUNS: int = int(os.getenv("ASSISTANT_MAX_ACTIVE_RUNS", "100"))
+    ASSISTANT_MAX_RUNS_PER_RESTAURANT: int = int(os.getenv("ASSISTANT_MAX_RUNS_PER_RESTAURANT", "20"))
+    ASSISTANT_MAX_QUEUE: int = int(os.getenv("ASSISTANT_MAX_QUEUE", "200"))
+    ASSISTANT_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("ASSISTANT_QUEUE_TIMEOUT_SECONDS", "10"))
+    ASSISTANT_RETRY_AFTER_SECONDS: int = int(os.getenv("ASSISTANT_RETRY_AFTER_SECONDS", "5"))
+    ASSISTANT_RUN_TIMEOUT_SECONDS: float = float(os.getenv("ASSISTANT_RUN_TIMEOUT_SECONDS", "30"))
+    ASSISTANT_POLL_MIN_INTERVAL_SECONDS: float = float(os.getenv("ASSISTANT_POLL_MIN_INTERVAL_SECONDS", "0.25"))
+    ASSISTANT_POLL_MAX_INTERVAL_SECONDS: float = float(os.getenv("ASSISTANT_POLL_MAX_INTERVAL_SECONDS", "2"))
+    ASSISTANT_POLL_CONCURRENCY: int = int(os.getenv("ASSISTANT_POLL_CONCURRENCY", "20"))
+    # Opt-in cache of assistant answers per restaurant
+    ASSISTANT_CACHE_TTL_SECONDS: int = int(os.getenv("ASSISTANT_CACHE_TTL_SECONDS", "86400"))
+    ASSISTANT_CACHE_MAX_ENTRIES: int = int(os.getenv("ASSISTANT_CACHE_MAX_ENTRIES", "1000"))
+    # Apply pending schema migrations when a worker starts (python -m app.migrations otherwise)
+    MIGRATE_ON_STARTUP: bool = os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+    MIGRATION_LOCK_TIMEOUT_SECONDS: float = float(os.getenv("MIGRATION_LOCK_TIMEOUT_SECONDS", "10"))
+    # Bearer token required by GET /metrics; empty leaves it open (restrict at the network level)
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    REDIS_MAX_CONNECTIONS: int = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
 
-    # Define restaurant-wide default time slots (local time strings HH:MM)
-    TIME_SLOTS: List[str] = [
-        "12:00",
-        "13:00",
-        "14:00",
-        "15:00",
-        "16:00",
-        "17:00",
-        "18:00",
-        "19:00",
-        "20:00",
-        "21:00",
-        "22:00",
-    ]
+    # In-process (per worker) slot cache in front of Redis
+    SLOTS_L1_MAX_ENTRIES: int = int(os.getenv("SLOTS_L1_MAX_ENTRIES", "1024"))
+    SLOTS_L1_TTL_SECONDS: float = float(os.getenv("SLOTS_L1_TTL_SECONDS", "60"))
+    # Cached days are fresh for SLOTS_CACHE_TTL_SECONDS, then served stale for up to
+    # SLOTS_STALE_SECONDS while one worker recomputes them in the background
+    SLOTS_CACHE_TTL_SECONDS: int = int(os.getenv("SLOTS_CACHE_TTL_SECONDS", "3600"))
+    SLOTS_STALE_SECONDS: int = int(os.getenv("SLOTS_STALE_SECONDS", "600"))
+    # Probabilistic early refresh (XFetch); 0 disables, higher refreshes earlier
+    SLOTS_XFETCH_BETA: float = float(os.getenv("SLOTS_XFETCH_BETA", "1.0"))
+    # Cross-worker recompute lock; other workers wait up to this long for the result
+    SLOTS_LOCK_TTL_SECONDS: float = float(os.getenv("SLOTS_LOCK_TTL_SECONDS", "5"))
+    # Longest span accepted by the multi-day slots endpoint
+    SLOTS_RANGE_MAX_DAYS: int = int(os.getenv("SLOTS_RANGE_MAX_DAYS", "92"))
+    # Periodic repair of slot counters/cache against the bookings table (0 disables)
+    SLOTS_RECONCILE_INTERVAL_SECONDS: float = float(os.getenv("SLOTS_RECONCILE_INTERVAL_SECONDS", "300"))
+    SLOTS_RECONCILE_DAYS: int = int(os.getenv("SLOTS_RECONCILE_DAYS", "30"))
+    # Background warming of the slot cache for the next SLOTS_WARM_DAYS days (0 disables)
+    SLOTS_WARM_INTERVAL_SECONDS: float = float(os.getenv("SLOTS_WARM_INTERVAL_SECONDS", "600"))
+    SLOTS_WARM_DAYS: int = int(os.getenv("SLOTS_WARM_DAYS", "14"))
+    SLOTS_WARM_CONCURRENCY: int = int(os.getenv("SLOTS_WARM_CONCURRENCY", "2"))
+    # Bulk import: rows per COPY batch and cap on per-row errors returned
+    IMPORT_CHUNK_ROWS: int = int(os.getenv("IMPORT_CHUNK_ROWS", "1000"))
+    IMPORT_MAX_ERRORS: int = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+    # Group commit of concurrent booking creations: requests arriving within the
+    # window (or until the batch is full) share one transaction
+    BOOKING_GROUP_COMMIT: bool = os.getenv("BOOKING_GROUP_COMMIT", "false").lower() in ("1", "true", "yes")
+    BOOKING_GROUP_COMMIT_WINDOW_MS: float = float(os.getenv("BOOKING_GROUP_COMMIT_WINDOW_MS", "5"))
+    BOOKING_GROUP_COMMIT_MAX_BATCH: int = int(os.getenv("BOOKING_GROUP_COMMIT_MAX_BATCH", "100"))
+    # Page size cap for booking search
+    SEARCH_MAX_LIMIT: int = int(os.getenv("SEARCH_MAX_LIMIT", "200"))
+    # Periodic rebuild of booking rollups from bookings for recent and upcoming days (0 disables)
+    ROLLUP_REBUILD_INTERVAL_SECONDS: float = float(os.getenv("ROLLUP_REBUILD_INTERVAL_SECONDS", "3600"))
+    ROLLUP_REBUILD_PAST_DAYS: int = int(os.getenv("ROLLUP_REBUILD_PAST_DAYS", "7"))
+    ROLLUP_REBUILD_FUTURE_DAYS: int = int(os.getenv("ROLLUP_REBUILD_FUTURE_DAYS", "90"))
+    # Analytics reports: longest span and how long a computed report is served from Redis
+    ANALYTICS_MAX_DAYS: int = int(os.getenv("ANALYTICS_MAX_DAYS", "731"))
+    ANALYTICS_CACHE_TTL_SECONDS: int = int(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+    # Longest span accepted by the per-day tag counts endpoint
+    TAG_COUNTS_MAX_DAYS: int = int(os.getenv("TAG_COUNTS_MAX_DAYS", "366"))
+    # Rows fetched per server-side cursor batch when exporting
+    EXPORT_BATCH_ROWS: int = int(os.getenv("EXPORT_BATCH_ROWS", "2000"))
 
 
 settings = Settings()
@@ -1,49 +1,114 @@
-from typing import AsyncGenerator
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, List, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from .config import settings
+from .instrumentation import instrument_engine
+from .metrics import counter
+
+
+logger = logging.getLogger(__name__)
+
+db_read_routing = counter("db_read_routing_total", "get_read_db sessions by target and reason")
 
 
 class Base(DeclarativeBase):
     pass
 
 
-engine = create_async_engine(settings.DB_URL, echo=False, future=True)
+def _create_engine(url: str, pool_size: int, max_overflow: int) -> AsyncEngine:
+    created = create_async_engine(url, echo=False, future=True, pool_size=pool_size, max_overflow=max_overflow)
+    instrument_engine(created.sync_engine)
+    return created
+
+
+engine = _create_engine(settings.DB_URL, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+read_engines: List[AsyncEngine] = [
+    _create_engine(url, settings.DB_READ_POOL_SIZE, settings.DB_READ_MAX_OVERFLOW) for url in settings.DB_READ_URLS
+]
+_read_sessions = [async_sessionmaker(e, expire_on_commit=False, class_=AsyncSession) for e in read_engines]
+_replica_turn = itertools.count()
+_replica_down_until = [0.0] * len(read_engines)
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
 
 
-async def init_db() -> None:
-    # Import models inside function to avoid circular imports
-    from .models import Restaurant, Booking  # noqa: F401
-
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        # best-effort schema upgrades for new booking fields
-        try:
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS start_time VARCHAR(10)")
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS end_time VARCHAR(10)")
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS phone VARCHAR(32)")
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS guest_count INTEGER")
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS comment TEXT")
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS tags TEXT")
-            await conn.exec_driver_sql("ALTER TABLE bookings ADD COLUMN IF NOT EXISTS deposit BOOLEAN DEFAULT FALSE NOT NULL")
-        except Exception:
-            pass
-
-    # Seed default restaurant with id=1 if not exists
-    from sqlalchemy import select
+def _next_replica() -> Optional[int]:
+    # round robin over the replicas that are not marked down
+    now = time.monotonic()
+    for _ in range(len(_read_sessions)):
+        index = next(_replica_turn) % len(_read_sessions)
+        if _replica_down_until[index] <= now:
+            return index
+    return None
+
+
+@asynccontextmanager
+async def read_session(restaurant_id: Optional[int] = None) -> AsyncIterator[AsyncSession]:
+    """Session for reads: a replica unless the restaurant was written recently.
+
+    Falls back to the primary without replicas, when every replica is down,
+    or when the picked one cannot be reached. Never use it for data that is
+    written back (caches), since replicas lag.
+    """
+    from .cache import is_pinned_to_primary
 
+    reason = "no_replicas"
+    if _read_sessions:
+        index = None
+        if restaurant_id is not None and await is_pinned_to_primary(restaurant_id):
+            reason = "pinned"
+        elif (index := _next_replica()) is None:
+            reason = "replicas_down"
+        else:
+            async with _read_sessions[index]() as session:
+                try:
+                    # connect now, so an unreachable replica can still fall back to the primary
+                    await session.connection()
+                except (OSError, DBAPIError) as e:
+                    logger.warning("read replica %d unreachable, using primary: %s", index, e)
+                    _replica_down_until[index] = time.monotonic() + settings.DB_REPLICA_RETRY_SECONDS
+                    reason = "replica_error"
+                else:
+                    db_read_routing.inc(target="replica", reason="ok")
+                    yield session
+                    return
+    db_read_routing.inc(target="primary", reason=reason)
     async with AsyncSessionLocal() as session:
-        result = await session.execute(select(Restaurant).where(Restaurant.id == 1))
-        restaurant = result.scalar_one_or_none()
-        if restaurant is None:
-            session.add(Restaurant(id=1, name="Default Restaurant", default_table_count=5))
-            await session.commit()
+        yield session
+
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """read_session dependency for read-only endpoints, pinned by the restaurant_id path parameter."""
+    try:
+        restaurant_id: Optional[int] = int(request.path_params["restaurant_id"])
+    except (KeyError, ValueError):
+        # no or a malformed id; FastAPI answers the latter with 422 itself
+        restaurant_id = None
+    async with read_session(restaurant_id) as session:
+        yield session
+
+
+async def close_db() -> None:
+    for e in (engine, *read_engines):
+        await e.dispose()
+
+
+async def init_db() -> None:
+    # schema changes live in app/migrations.py; import here to avoid a circular import
+    from .migrations import migrate
 
+    if settings.MIGRATE_ON_STARTUP:
+        await migrate()
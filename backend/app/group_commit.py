@@ -0,0 +1,262 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .availability import Schedule
+from .cache import pin_to_primary, write_through_slots
+from .config import settings
+from .db import AsyncSessionLocal
+from .metrics import histogram
+from .models import Booking, Restaurant
+from .rollups import add_to_rollups, set_table_minutes
+from .schemas import BookingCreate
+from .seating import DayBook, NoCapacity, Placement, load_day_books, save_assignments
+from .slots import lock_days
+
+
+logger = logging.getLogger(__name__)
+
+batch_sizes = histogram(
+    "booking_group_commit_batch_size",
+    "Bookings per group-commit transaction",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+DedupKey = Tuple[int, date, str, str]
+
+
+def booking_values(payload: BookingCreate) -> Dict[str, Any]:
+    """Column values of a new booking row."""
+    return {
+        "restaurant_id": payload.restaurant_id,
+        "date": payload.date,
+        "time_slot": payload.time_slot,
+        "client_name": payload.client_name,
+        "start_time": payload.start_time,
+        "end_time": payload.end_time,
+        "phone": payload.phone,
+        "guest_count": payload.guest_count,
+        "comment": payload.comment,
+        "tags": ','.join(payload.tags) if payload.tags else None,
+        "tag_list": payload.tags or [],
+        "deposit": bool(payload.deposit),
+    }
+
+
+@dataclass
+class _Pending:
+    payload: BookingCreate
+    future: asyncio.Future
+
+
+def _resolve(pending: _Pending, result: Any) -> None:
+    # the client may have gone away (cancelled future); its booking still stands
+    if pending.future.done():
+        return
+    if isinstance(result, BaseException):
+        pending.future.set_exception(result)
+    else:
+        pending.future.set_result(result)
+
+
+async def _commit_batch(db: AsyncSession, batch: List[_Pending]) -> Dict[int, Any]:
+    """Place and insert a batch in one transaction; result (response dict or HTTPException) per batch index."""
+    results: Dict[int, Any] = {}
+    rids = sorted({p.payload.restaurant_id for p in batch})
+    restaurants = {r.id: r for r in (await db.execute(select(Restaurant).where(Restaurant.id.in_(rids)))).scalars()}
+
+    schedules: Dict[int, Schedule] = {}
+    accepted: List[Tuple[int, BookingCreate, int, int]] = []
+    for i, pending in enumerate(batch):
+        payload = pending.payload
+        restaurant = restaurants.get(payload.restaurant_id)
+        if restaurant is None:
+            results[i] = HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+            continue
+        schedule = schedules.setdefault(restaurant.id, Schedule.of(restaurant))
+        if schedule.slot_start(payload.time_slot) is None:
+            results[i] = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid time slot")
+            continue
+        try:
+            start, end = schedule.booking_interval(payload.time_slot, payload.start_time, payload.end_time)
+        except ValueError as e:
+            results[i] = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            continue
+        accepted.append((i, payload, start, end))
+    if not accepted:
+        return results
+
+    # the same day locks as the per-request path, taken in (restaurant, day) order
+    days: Dict[int, Set[date]] = defaultdict(set)
+    for _, payload, _, _ in accepted:
+        days[payload.restaurant_id].add(payload.date)
+    books: Dict[Tuple[int, date], DayBook] = {}
+    for rid in sorted(days):
+        await lock_days(db, rid, sorted(days[rid]))
+        for day, book in (await load_day_books(db, rid, schedules[rid], sorted(days[rid]))).items():
+            books[(rid, day)] = book
+
+    keys = [(p.restaurant_id, p.date, p.time_slot, p.client_name) for _, p, _, _ in accepted]
+    taken: Set[DedupKey] = set(
+        (await db.execute(
+            select(Booking.restaurant_id, Booking.date, Booking.time_slot, Booking.client_name)
+            .where(tuple_(Booking.restaurant_id, Booking.date, Booking.time_slot, Booking.client_name).in_(keys))
+        )).tuples().all()
+    )
+
+    # place in arrival order; each new booking gets a temporary negative id until the INSERT
+    placements: Dict[int, Placement] = {}
+    rows: List[Tuple[int, int, DedupKey, Dict[str, Any]]] = []
+    for n, ((i, payload, start, end), key) in enumerate(zip(accepted, keys), start=1):
+        if key in taken:
+            results[i] = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Booking already exists")
+            continue
+        try:
+            placements[-n] = books[(payload.restaurant_id, payload.date)].reserve(-n, payload.guest_count or 1, start, end)
+        except NoCapacity as e:
+            results[i] = HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+            continue
+        taken.add(key)
+        rows.append((i, -n, key, booking_values(payload)))
+    if not rows:
+        return results
+
+    # one multi-row INSERT; the day locks rule out duplicates, DO NOTHING is only a guard
+    stmt = (
+        insert(Booking)
+        .values([values for _, _, _, values in rows])
+        .on_conflict_do_nothing(constraint="uq_booking_dedup")
+        .returning(Booking.id, Booking.restaurant_id, Booking.date, Booking.time_slot, Booking.client_name)
+    )
+    inserted = {tuple(row[1:]): row[0] for row in (await db.execute(stmt)).all()}
+    real_ids = {temp: inserted[key] for _, temp, key, _ in rows if key in inserted}
+
+    # later placements may move earlier ones, so apply them in order
+    assignments: Dict[int, Tuple[int, ...]] = {}
+    for temp, (table_ids, moves) in placements.items():
+        if temp not in real_ids:
+            continue
+        if table_ids:
+            assignments[real_ids[temp]] = table_ids
+        for booking_id, new_tables in moves:
+            assignments[real_ids.get(booking_id, booking_id)] = new_tables
+    await save_assignments(db, assignments)
+    await add_to_rollups(db, [values for _, temp, _, values in rows if temp in real_ids])
+    for rid in sorted(days):
+        await set_table_minutes(db, rid, {day: books[(rid, day)].occupancy for day in days[rid]})
+
+    # one cache write per affected day, still under the day locks
+    for (rid, day), book in books.items():
+        await write_through_slots(rid, day, book.occupancy.slot_booked(), schedules[rid].tables)
+    await db.commit()
+
+    for rid in {key[0] for _, temp, key, _ in rows if temp in real_ids}:
+        await pin_to_primary(rid)
+    for i, temp, _, _ in rows:
+        if temp in real_ids:
+            booking_id = real_ids[temp]
+            results[i] = {"status": "ok", "booking_id": booking_id, "table_ids": list(assignments.get(booking_id, ()))}
+        else:
+            results[i] = HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Booking already exists")
+    return results
+
+
+class GroupCommitter:
+    """Collects concurrent create_booking requests for a few milliseconds and commits them together.
+
+    One transaction per batch means one fsync, one capacity load and one
+    cache write per day instead of one per booking. Batches run one at a
+    time per worker; requests arriving meanwhile form the next batch.
+    """
+
+    def __init__(self, window_seconds: float, max_batch: int) -> None:
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, payload: BookingCreate) -> Dict[str, Any]:
+        """Same response (or HTTPException) as the per-request create_booking path."""
+        if self._task is None or self._task.done():
+            if self._task is not None and not self._task.cancelled() and self._task.exception() is not None:
+                logger.error("group commit worker died, restarting", exc_info=self._task.exception())
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(payload, future))
+        return await future
+
+    async def _collect(self) -> List[_Pending]:
+        assert self._queue is not None
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            batch_sizes.observe(len(batch))
+            try:
+                results = await self._commit(batch)
+                for i, pending in enumerate(batch):
+                    _resolve(pending, results[i])
+            except asyncio.CancelledError:
+                for pending in batch:
+                    _resolve(pending, HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Shutting down"))
+                raise
+            except BaseException:
+                # the worker dies; the next submit starts a new one, nobody in this batch is left waiting
+                for pending in batch:
+                    _resolve(pending, HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Booking commit failed"))
+                raise
+
+    async def _commit(self, batch: List[_Pending]) -> Dict[int, Any]:
+        try:
+            async with AsyncSessionLocal() as db:
+                return await _commit_batch(db, batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.exception("booking commit failed")
+                return {0: e}
+            # one bad booking must not fail its neighbours: retry each in its own transaction
+            logger.exception("group commit of %d bookings failed, committing them one by one", len(batch))
+            results: Dict[int, Any] = {}
+            for i, pending in enumerate(batch):
+                results[i] = (await self._commit([pending]))[0]
+            return results
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        while self._queue is not None and not self._queue.empty():
+            _resolve(self._queue.get_nowait(), HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Shutting down"))
+        self._task = None
+
+
+group_committer = GroupCommitter(
+    settings.BOOKING_GROUP_COMMIT_WINDOW_MS / 1000.0,
+    settings.BOOKING_GROUP_COMMIT_MAX_BATCH,
+)
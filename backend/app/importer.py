@@ -0,0 +1,258 @@
+import codecs
+import csv
+import io
+import json
+import tempfile
+from datetime import date
+from typing import IO, Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .availability import Schedule, load_occupancy
+from .config import settings
+from .models import Restaurant
+from .rollups import set_table_minutes
+from .schemas import BookingCreate, ImportReport, ImportRowError
+from .slots import lock_days
+
+
+STAGING_COLUMNS = [
+    "line",
+    "restaurant_id",
+    "date",
+    "time_slot",
+    "client_name",
+    "start_time",
+    "end_time",
+    "phone",
+    "guest_count",
+    "comment",
+    "tags",
+    "tag_list",
+    "deposit",
+]
+
+# CSV bodies are spooled before parsing; larger ones go to disk
+CSV_SPOOL_BYTES = 8 * 1024 * 1024
+
+_REJECT_REASONS = {
+    "duplicate": "Duplicate of an earlier row in the file",
+    "exists": "Booking already exists",
+    "full": "No free tables for selected slot",
+}
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def _spool(chunks: AsyncIterator[bytes]) -> IO[bytes]:
+    """Copy the body into a temp file, in memory up to CSV_SPOOL_BYTES, for csv.reader to read synchronously."""
+    body = tempfile.SpooledTemporaryFile(max_size=CSV_SPOOL_BYTES)
+    async for chunk in chunks:
+        body.write(chunk)
+    body.seek(0)
+    return body
+
+
+async def _iter_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (line number, raw row) pairs; a row that cannot be parsed is yielded as an exception."""
+    if fmt == "ndjson":
+        line_no = 0
+        async for line in _iter_lines(chunks):
+            line_no += 1
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+        return
+
+    header: Optional[List[str]] = None
+    # one reader over the whole body: a quoted field may span lines, a stray quote inside a field is literal
+    with await _spool(chunks) as body:
+        reader = csv.reader(io.TextIOWrapper(body, encoding="utf-8-sig", newline=""))
+        while True:
+            line_no = reader.line_num + 1
+            try:
+                values = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                yield line_no, ValueError(str(e))
+                continue
+            if not values or (len(values) == 1 and not values[0].strip()):
+                continue
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            if len(values) != len(header):
+                yield line_no, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+                continue
+            row: Dict[str, Any] = {k: v for k, v in zip(header, values) if v != ""}
+            if "tags" in row:
+                row["tags"] = [t.strip() for t in row["tags"].split(";") if t.strip()]
+            yield line_no, row
+
+
+def _validate(line_no: int, raw: Any, restaurant_id: int, schedule: Schedule) -> Tuple[Optional[tuple], Optional[str]]:
+    if isinstance(raw, Exception):
+        return None, f"Unparseable row: {raw}"
+    if not isinstance(raw, dict):
+        return None, "Row must be an object"
+    raw.setdefault("restaurant_id", restaurant_id)
+    try:
+        payload = BookingCreate.model_validate(raw)
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+    if payload.restaurant_id != restaurant_id:
+        return None, "restaurant_id does not match the import target"
+    if schedule.slot_start(payload.time_slot) is None:
+        return None, "Invalid time slot"
+    try:
+        schedule.booking_interval(payload.time_slot, payload.start_time, payload.end_time)
+    except ValueError as e:
+        return None, str(e)
+    record = (
+        line_no,
+        payload.restaurant_id,
+        payload.date,
+        payload.time_slot,
+        payload.client_name,
+        payload.start_time,
+        payload.end_time,
+        payload.phone,
+        payload.guest_count,
+        payload.comment,
+        ','.join(payload.tags) if payload.tags else None,
+        payload.tags or [],
+        bool(payload.deposit),
+    )
+    return record, None
+
+
+async def import_bookings(
+    db: AsyncSession,
+    restaurant: Restaurant,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+) -> Tuple[ImportReport, List[date]]:
+    """Stream rows into a temp staging table with COPY, then merge them into bookings.
+
+    Returns the report and the days whose availability changed. The merge runs
+    in the caller's transaction after the body is fully staged; the caller
+    commits.
+    """
+    report = ImportReport()
+    schedule = Schedule.of(restaurant)
+
+    def reject(line_no: int, error: str) -> None:
+        report.rejected += 1
+        if len(report.errors) < settings.IMPORT_MAX_ERRORS:
+            report.errors.append(ImportRowError(line=line_no, error=error))
+
+    await db.execute(text(
+        "CREATE TEMP TABLE import_staging ("
+        " line INTEGER PRIMARY KEY, restaurant_id INTEGER, date DATE, time_slot VARCHAR(10),"
+        " client_name VARCHAR(255), start_time VARCHAR(10), end_time VARCHAR(10), phone VARCHAR(32),"
+        " guest_count INTEGER, comment TEXT, tags TEXT, tag_list TEXT[], deposit BOOLEAN, status VARCHAR(16)"
+        ") ON COMMIT DROP"
+    ))
+    raw_conn = await (await db.connection()).get_raw_connection()
+    copy_conn = raw_conn.driver_connection
+
+    batch: List[tuple] = []
+    async for line_no, raw in _iter_rows(chunks, fmt):
+        report.total += 1
+        record, error = _validate(line_no, raw, restaurant.id, schedule)
+        if error is not None:
+            reject(line_no, error)
+            continue
+        batch.append(record)
+        if len(batch) >= settings.IMPORT_CHUNK_ROWS:
+            await copy_conn.copy_records_to_table("import_staging", records=batch, columns=STAGING_COLUMNS)
+            batch = []
+    if batch:
+        await copy_conn.copy_records_to_table("import_staging", records=batch, columns=STAGING_COLUMNS)
+
+    # Lock every touched day (in order, like create_booking) so live bookings
+    # for these days wait for the merge instead of overbooking.
+    staged_days = [row[0] for row in (await db.execute(text("SELECT DISTINCT date FROM import_staging"))).all()]
+    await lock_days(db, restaurant.id, staged_days)
+
+    # Classify rows: repeats within the file, rows already booked, rows over capacity
+    await db.execute(text(
+        "UPDATE import_staging s SET status = 'duplicate' FROM import_staging o "
+        "WHERE o.date = s.date AND o.time_slot = s.time_slot AND o.client_name = s.client_name AND o.line < s.line"
+    ))
+    await db.execute(text(
+        "UPDATE import_staging s SET status = 'exists' FROM bookings b "
+        "WHERE s.status IS NULL AND b.restaurant_id = s.restaurant_id AND b.date = s.date "
+        "AND b.time_slot = s.time_slot AND b.client_name = s.client_name"
+    ))
+    # Capacity: rows are placed in file order onto each day's occupancy; a row
+    # that does not fit its whole stay is rejected, later shorter rows may still fit
+    occupancy = await load_occupancy(db, restaurant.id, schedule, staged_days)
+    pending = await db.execute(text(
+        "SELECT line, date, time_slot, start_time, end_time FROM import_staging WHERE status IS NULL ORDER BY line"
+    ))
+    full: List[int] = []
+    for line_no, day, time_slot, start_time, end_time in pending.all():
+        start, end = schedule.interval(time_slot, start_time, end_time)
+        if occupancy[day].fits(start, end):
+            occupancy[day].add(start, end)
+        else:
+            full.append(line_no)
+    if full:
+        await db.execute(
+            text("UPDATE import_staging SET status = 'full' WHERE line = ANY(:lines)"),
+            {"lines": full},
+        )
+
+    await db.execute(text(
+        "WITH ins AS ("
+        " INSERT INTO bookings (restaurant_id, date, time_slot, client_name, start_time, end_time,"
+        "  phone, guest_count, comment, tags, tag_list, deposit)"
+        " SELECT restaurant_id, date, time_slot, client_name, start_time, end_time,"
+        "  phone, guest_count, comment, tags, tag_list, deposit"
+        " FROM import_staging WHERE status IS NULL ORDER BY line"
+        " ON CONFLICT ON CONSTRAINT uq_booking_dedup DO NOTHING"
+        " RETURNING date, time_slot, client_name"
+        ") UPDATE import_staging s SET status = 'inserted' FROM ins "
+        "WHERE s.status IS NULL AND s.date = ins.date AND s.time_slot = ins.time_slot AND s.client_name = ins.client_name"
+    ))
+    await db.execute(text("UPDATE import_staging SET status = 'exists' WHERE status IS NULL"))
+    await db.execute(text(
+        "INSERT INTO booking_rollups (restaurant_id, date, time_slot, bookings, guests, deposits)"
+        " SELECT restaurant_id, date, time_slot, count(*), sum(coalesce(guest_count, 1)), count(*) FILTER (WHERE deposit)"
+        " FROM import_staging WHERE status = 'inserted' GROUP BY restaurant_id, date, time_slot"
+        " ORDER BY restaurant_id, date, time_slot"
+        " ON CONFLICT (restaurant_id, date, time_slot) DO UPDATE SET"
+        " bookings = booking_rollups.bookings + EXCLUDED.bookings,"
+        " guests = booking_rollups.guests + EXCLUDED.guests,"
+        " deposits = booking_rollups.deposits + EXCLUDED.deposits"
+    ))
+
+    result = await db.execute(text("SELECT line, status FROM import_staging WHERE status <> 'inserted' ORDER BY line"))
+    for line_no, status in result.all():
+        reject(line_no, _REJECT_REASONS[status])
+    result = await db.execute(text("SELECT count(*) FROM import_staging WHERE status = 'inserted'"))
+    report.inserted = int(result.scalar() or 0)
+    report.errors.sort(key=lambda e: e.line)
+    result = await db.execute(text("SELECT DISTINCT date FROM import_staging WHERE status = 'inserted'"))
+    changed_days = [row[0] for row in result.all()]
+    await set_table_minutes(db, restaurant.id, {d: occupancy[d] for d in changed_days})
+    return report, changed_days
@@ -0,0 +1,142 @@
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import httpx
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .metrics import histogram
+
+
+http_request_seconds = histogram("http_request_duration_seconds", "Request latency by route template, method and status")
+db_query_seconds = histogram("db_query_duration_seconds", "SQL statement latency by statement kind and table")
+redis_command_seconds = histogram("redis_command_duration_seconds", "Redis round trip latency by command (PIPELINE for batches)")
+upstream_request_seconds = histogram(
+    "upstream_request_duration_seconds",
+    "Assistants API latency until response headers, by endpoint, method and status",
+)
+
+
+class MetricsMiddleware:
+    """Per-route latency histogram; plain ASGI so streamed responses are timed to their last chunk."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._templates: Optional[Dict[Any, str]] = None
+
+    def _route(self, scope: Scope) -> str:
+        # label by template, not raw path, so ids do not explode the series count
+        if self._templates is None:
+            self._templates = {
+                getattr(r, "endpoint", None): r.path for r in scope["app"].routes if hasattr(r, "endpoint")
+            }
+        return self._templates.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_request_seconds.observe(
+                time.perf_counter() - started, route=self._route(scope), method=scope["method"], status=status
+            )
+
+
+_TABLE_RE = re.compile(r'\b(?:FROM|INTO)\s+"?([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def statement_label(statement: str) -> str:
+    """"SELECT bookings"-style label: verb plus the first table, stable across parameter values."""
+    words = statement.split(None, 2)
+    if not words:
+        return "other"
+    verb = words[0].upper()
+    if verb == "UPDATE" and len(words) > 1:
+        table: Optional[str] = words[1].strip('"')
+    elif verb in ("SELECT", "INSERT", "DELETE", "WITH", "COPY"):
+        match = _TABLE_RE.search(statement)
+        table = match.group(1) if match else None
+    else:
+        # DDL and session commands; the verb is enough
+        table = None
+    return f"{verb} {table.lower()}" if table else verb
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement of a (sync) engine; pass AsyncEngine.sync_engine for async engines."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is not None:
+            db_query_seconds.observe(time.perf_counter() - started, statement=statement_label(statement))
+
+
+class TimedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_seconds.observe(time.perf_counter() - started, command="PIPELINE")
+
+
+class TimedRedis(Redis):
+    """Redis client that records the latency of each command and pipeline."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_seconds.observe(time.perf_counter() - started, command=str(args[0]).upper())
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> Pipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# thread_abc, run_abc, msg_abc, asst_abc ids in upstream paths
+_UPSTREAM_ID_RE = re.compile(r"/(?:thread|run|msg|asst|step)_[A-Za-z0-9]+")
+
+
+def upstream_endpoint(path: str) -> str:
+    return _UPSTREAM_ID_RE.sub("/{id}", path)
+
+
+async def _upstream_request_started(request: httpx.Request) -> None:
+    request.extensions["metrics_started"] = time.perf_counter()
+
+
+async def _upstream_response(response: httpx.Response) -> None:
+    started = response.request.extensions.get("metrics_started")
+    if started is not None:
+        upstream_request_seconds.observe(
+            time.perf_counter() - started,
+            endpoint=upstream_endpoint(response.request.url.path),
+            method=response.request.method,
+            status=str(response.status_code),
+        )
+
+
+UPSTREAM_EVENT_HOOKS = {"request": [_upstream_request_started], "response": [_upstream_response]}
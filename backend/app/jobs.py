@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, List
+
+from sqlalchemy import select
+
+from .availability import SCHEDULE_COLUMNS
+from .cache import acquire_lease, drop_cached_slots, expiring_cached_days, peek_cached_counts, set_cached_slots_many
+from .config import settings
+from .db import AsyncSessionLocal
+from .rollups import rebuild_all
+from .slots import count_bookings
+
+
+logger = logging.getLogger(__name__)
+
+_tasks: List[asyncio.Task] = []
+
+
+async def _run_periodic(
+    name: str,
+    interval_s: float,
+    job: Callable[[], Awaitable[None]],
+    run_on_start: bool = False,
+) -> None:
+    first = run_on_start
+    while True:
+        # jitter keeps workers started together from hitting the lease at the same instant
+        await asyncio.sleep(random.uniform(0.0, 1.0) if first else interval_s * random.uniform(0.9, 1.1))
+        first = False
+        try:
+            if await acquire_lease(name, interval_s * 0.8):
+                await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("periodic job %s failed", name)
+
+
+async def reconcile_slots() -> None:
+    """Drop cached slot days that drifted from the bookings table."""
+    today = date.today()
+    days = [today + timedelta(days=i) for i in range(-1, settings.SLOTS_RECONCILE_DAYS)]
+    async with AsyncSessionLocal() as db:
+        restaurants = (await db.execute(select(*SCHEDULE_COLUMNS))).all()
+        for restaurant in restaurants:
+            counts = await count_bookings(db, restaurant, days)
+            # Drifted entries are dropped rather than rewritten so a racing
+            # booking's cache write cannot be overwritten; the next read recomputes.
+            cached = await peek_cached_counts(restaurant.id, [d.isoformat() for d in days])
+            stale: List[str] = []
+            for day in days:
+                entry = cached.get(day.isoformat())
+                if entry is None:
+                    continue
+                cached_counts, cached_tables = entry
+                if cached_counts != counts[day] or cached_tables != restaurant.default_table_count:
+                    stale.append(day.isoformat())
+            if stale:
+                logger.info("dropping %d drifted slot cache entries for restaurant %s", len(stale), restaurant.id)
+                await drop_cached_slots(restaurant.id, stale)
+            # end the read transaction between restaurants
+            await db.rollback()
+
+
+async def _warm_restaurant(restaurant: Any, days: List[date], limiter: asyncio.Semaphore) -> None:
+    async with limiter:
+        # only days that are missing or would turn stale before the next round
+        due = await expiring_cached_days(
+            restaurant.id, [d.isoformat() for d in days], settings.SLOTS_WARM_INTERVAL_SECONDS * 1.1
+        )
+        if not due:
+            return
+        started = time.monotonic()
+        async with AsyncSessionLocal() as db:
+            counts = await count_bookings(db, restaurant, [date.fromisoformat(d) for d in due])
+        await set_cached_slots_many(
+            restaurant.id,
+            {d.isoformat(): c for d, c in counts.items()},
+            restaurant.default_table_count,
+            broadcast=True,
+            compute_seconds=(time.monotonic() - started) / len(due),
+        )
+
+
+async def warm_slots() -> None:
+    """Keep the slot cache of every restaurant warm for the upcoming days, one query per restaurant."""
+    today = date.today()
+    days = [today + timedelta(days=i) for i in range(settings.SLOTS_WARM_DAYS)]
+    async with AsyncSessionLocal() as db:
+        restaurants = (await db.execute(select(*SCHEDULE_COLUMNS))).all()
+    # a few restaurants at a time so warming never takes over the connection pool
+    limiter = asyncio.Semaphore(settings.SLOTS_WARM_CONCURRENCY)
+    results = await asyncio.gather(
+        *(_warm_restaurant(restaurant, days, limiter) for restaurant in restaurants),
+        return_exceptions=True,
+    )
+    for restaurant, result in zip(restaurants, results):
+        if isinstance(result, Exception):
+            logger.warning("warming slot cache for restaurant %s failed: %s", restaurant.id, result)
+
+
+async def rebuild_recent_rollups() -> None:
+    """Repair drifted rollups of recent and upcoming days, where bookings still change."""
+    today = date.today()
+    await rebuild_all(
+        today - timedelta(days=settings.ROLLUP_REBUILD_PAST_DAYS),
+        today + timedelta(days=settings.ROLLUP_REBUILD_FUTURE_DAYS),
+    )
+
+
+def start_jobs() -> None:
+    if settings.SLOTS_RECONCILE_INTERVAL_SECONDS > 0:
+        _tasks.append(asyncio.create_task(_run_periodic("reconcile_slots", settings.SLOTS_RECONCILE_INTERVAL_SECONDS, reconcile_slots)))
+    if settings.SLOTS_WARM_INTERVAL_SECONDS > 0 and settings.SLOTS_WARM_DAYS > 0:
+        _tasks.append(asyncio.create_task(
+            _run_periodic("warm_slots", settings.SLOTS_WARM_INTERVAL_SECONDS, warm_slots, run_on_start=True)
+        ))
+    if settings.ROLLUP_REBUILD_INTERVAL_SECONDS > 0:
+        _tasks.append(asyncio.create_task(
+            _run_periodic("rebuild_rollups", settings.ROLLUP_REBUILD_INTERVAL_SECONDS, rebuild_recent_rollups)
+        ))
+
+
+async def stop_jobs() -> None:
+    for task in _tasks:
+        task.cancel()
+    for task in _tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _tasks.clear()
@@ -1,12 +1,48 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .cache import close_cache, init_cache
 from .config import settings
-from .db import init_db
+from .db import close_db, init_db
+from .group_commit import group_committer
+from .instrumentation import MetricsMiddleware
+from .jobs import start_jobs, stop_jobs
+from .metrics import gauge
 from .routers import api_router
+from .run_tracker import run_tracker
+from .upstream import close_upstream, get_upstream_client
+
+
+logger = logging.getLogger(__name__)
 
+startup_seconds = gauge("app_startup_seconds", "Time this worker spent in startup (migrations, cache, clients)")
 
-app = FastAPI(title="Restaurant CRM API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    started = time.monotonic()
+    await init_db()
+    await init_cache()
+    get_upstream_client()
+    start_jobs()
+    startup_seconds.set(time.monotonic() - started)
+    logger.info("worker started in %.3fs", time.monotonic() - started)
+    try:
+        yield
+    finally:
+        await stop_jobs()
+        await group_committer.close()
+        await run_tracker.close()
+        await close_upstream()
+        await close_cache()
+        await close_db()
+
+
+app = FastAPI(title="Restaurant CRM API", version="0.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,12 +51,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-
-@app.on_event("startup")
-async def on_startup() -> None:
-    await init_db()
+# outermost, so the latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
 
 
 app.include_router(api_router)
-
@@ -0,0 +1,157 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Seconds; covers an L1 cache hit up to a slow upstream assistant call
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    """Monotonic in-process counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[Tuple[LabelKey, float]]:
+        return iter(list(self._values.items()))
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """In-process histogram with fixed buckets, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket (last is +Inf)..., sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        row = self._values.get(key)
+        if row is None:
+            row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+        # le is inclusive: a value equal to a bound falls into that bucket
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def count(self, **labels: str) -> int:
+        row = self._values.get(tuple(sorted(labels.items())))
+        return int(sum(row[:-1])) if row else 0
+
+    def samples(self) -> Iterator[Tuple[LabelKey, List[float]]]:
+        return iter(list(self._values.items()))
+
+
+class CallbackGauge:
+    """Gauge computed at scrape time, e.g. a ratio of two counters."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._collect = collect
+
+    def samples(self) -> Iterator[Tuple[LabelKey, float]]:
+        return iter([(tuple(sorted(labels.items())), value) for labels, value in self._collect()])
+
+
+Metric = Union[Counter, Histogram, CallbackGauge]
+
+REGISTRY: List[Metric] = []
+
+
+def counter(name: str, documentation: str) -> Counter:
+    metric = Counter(name, documentation)
+    REGISTRY.append(metric)
+    return metric
+
+
+def gauge(name: str, documentation: str) -> Gauge:
+    metric = Gauge(name, documentation)
+    REGISTRY.append(metric)
+    return metric
+
+
+def histogram(name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    metric = Histogram(name, documentation, buckets)
+    REGISTRY.append(metric)
+    return metric
+
+
+def callback_gauge(
+    name: str,
+    documentation: str,
+    collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+) -> CallbackGauge:
+    metric = CallbackGauge(name, documentation, collect)
+    REGISTRY.append(metric)
+    return metric
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(str(v))}"' for k, v in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(registry: Iterable[Metric] = REGISTRY) -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        if isinstance(metric, Histogram):
+            for key, row in metric.samples():
+                cumulative = 0
+                for bound, n in zip((*metric.buckets, float("inf")), row[:-1]):
+                    cumulative += n
+                    le = 'le="%s"' % _number(bound)
+                    lines.append(f"{metric.name}_bucket{_labels(key, le)} {cumulative}")
+                lines.append(f"{metric.name}_sum{_labels(key)} {_number(row[-1])}")
+                lines.append(f"{metric.name}_count{_labels(key)} {cumulative}")
+        else:
+            for key, value in metric.samples():
+                lines.append(f"{metric.name}{_labels(key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
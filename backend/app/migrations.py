@@ -0,0 +1,276 @@
+"""Versioned schema migrations.
+
+Each migration runs once and is recorded in schema_migrations. A process
+takes a session advisory lock before migrating; when another process holds
+it, this one does not wait and starts serving. When the schema is already
+current, startup costs two catalog lookups and takes no locks.
+
+Migrations are append-only: never edit one that has shipped, add a new one.
+Statements are idempotent (IF NOT EXISTS), so a database created by the old
+create_all startup is adopted by replaying them. Indexes on live tables are
+built with CREATE INDEX CONCURRENTLY in non-transactional migrations.
+
+    python -m app.migrations    # apply pending migrations, e.g. as a deploy step
+"""
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+from .db import engine
+
+
+logger = logging.getLogger(__name__)
+
+# Key for pg_try_advisory_lock(bigint) ("crm_migr"); the per-day booking locks use the
+# two-int4 form, a separate key space
+MIGRATION_LOCK_KEY = 0x63726D5F6D696772
+
+SCHEMA_TABLE = "schema_migrations"
+
+
+@dataclass(frozen=True)
+class Backfill:
+    """UPDATE of a live table in primary-key ranges, each committed on its own.
+
+    statement takes the range as $1 < id <= $2; rows inserted after the
+    backfill starts must be covered by the application or a trigger.
+    """
+    table: str
+    statement: str
+    batch_rows: int = 5000
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: Tuple[str, ...]
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction; such migrations run
+    # statement by statement and must be safe to re-run after a partial failure
+    transactional: bool = True
+    # runs before the statements; non-transactional migrations only
+    backfill: Optional[Backfill] = None
+
+
+MIGRATIONS: Sequence[Migration] = (
+    Migration(1, "baseline", (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        """CREATE TABLE IF NOT EXISTS restaurants (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            default_table_count INTEGER NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS bookings (
+            id SERIAL PRIMARY KEY,
+            restaurant_id INTEGER NOT NULL REFERENCES restaurants (id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            time_slot VARCHAR(10) NOT NULL,
+            client_name VARCHAR(255) NOT NULL,
+            CONSTRAINT uq_booking_dedup UNIQUE (restaurant_id, date, time_slot, client_name)
+        )""",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS start_time VARCHAR(10)",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS end_time VARCHAR(10)",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS phone VARCHAR(32)",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS guest_count INTEGER",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS comment TEXT",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS tags TEXT",
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS deposit BOOLEAN DEFAULT FALSE NOT NULL",
+        """CREATE TABLE IF NOT EXISTS restaurant_settings (
+            restaurant_id INTEGER PRIMARY KEY REFERENCES restaurants (id) ON DELETE CASCADE,
+            host_choice VARCHAR(100),
+            greeting_text TEXT,
+            info_text TEXT
+        )""",
+        # the default restaurant the v1 login maps to; keep the sequence past it
+        "INSERT INTO restaurants (id, name, default_table_count) VALUES (1, 'Default Restaurant', 5) ON CONFLICT (id) DO NOTHING",
+        "SELECT setval(pg_get_serial_sequence('restaurants', 'id'), (SELECT max(id) FROM restaurants))",
+    )),
+    Migration(2, "restaurant_schedule", (
+        # defaults reproduce the former global 12:00-22:00 hourly grid
+        "ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS open_time VARCHAR(5) NOT NULL DEFAULT '12:00'",
+        "ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS close_time VARCHAR(5) NOT NULL DEFAULT '23:00'",
+        "ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS slot_minutes INTEGER NOT NULL DEFAULT 60",
+        "ALTER TABLE restaurants ADD COLUMN IF NOT EXISTS booking_minutes INTEGER NOT NULL DEFAULT 60",
+        # capacity is checked against booking intervals under a per-day lock now
+        "DROP TABLE IF EXISTS slot_counters",
+    )),
+    Migration(3, "seating", (
+        """CREATE TABLE IF NOT EXISTS restaurant_tables (
+            id SERIAL PRIMARY KEY,
+            restaurant_id INTEGER NOT NULL REFERENCES restaurants (id) ON DELETE CASCADE,
+            name VARCHAR(64) NOT NULL,
+            seats INTEGER NOT NULL,
+            combine_group VARCHAR(64)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_restaurant_tables_restaurant_id ON restaurant_tables (restaurant_id)",
+        """CREATE TABLE IF NOT EXISTS booking_tables (
+            booking_id INTEGER NOT NULL REFERENCES bookings (id) ON DELETE CASCADE,
+            table_id INTEGER NOT NULL REFERENCES restaurant_tables (id) ON DELETE CASCADE,
+            PRIMARY KEY (booking_id, table_id)
+        )""",
+        "CREATE INDEX IF NOT EXISTS ix_booking_tables_table_id ON booking_tables (table_id)",
+    )),
+    Migration(4, "booking_indexes", (
+        # day views and keyset pagination order by (date, time_slot, id) within a restaurant
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bookings_restaurant_date_slot_id "
+        "ON bookings (restaurant_id, date, time_slot, id)",
+        # substring/prefix search on guest name (ILIKE)
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bookings_client_name_trgm "
+        "ON bookings USING gin (client_name gin_trgm_ops)",
+        # returning-guest lookup by phone regardless of formatting; same expression as models.phone_digits
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bookings_restaurant_phone_digits "
+        "ON bookings (restaurant_id, regexp_replace(phone, '[^0-9]', '', 'g'))",
+    ), transactional=False),
+    Migration(5, "booking_tag_list", (
+        # nullable without default: instant on a large table, the backfill fills old rows
+        "ALTER TABLE bookings ADD COLUMN IF NOT EXISTS tag_list TEXT[]",
+        # workers still on the comma-joined column (rolling deploy, rollback) insert without tag_list
+        """CREATE OR REPLACE FUNCTION bookings_fill_tag_list() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.tag_list IS NULL THEN
+                NEW.tag_list := coalesce(array_remove(string_to_array(NEW.tags, ','), ''), '{}');
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql""",
+        "DROP TRIGGER IF EXISTS bookings_fill_tag_list ON bookings",
+        "CREATE TRIGGER bookings_fill_tag_list BEFORE INSERT ON bookings "
+        "FOR EACH ROW EXECUTE FUNCTION bookings_fill_tag_list()",
+    )),
+    Migration(6, "booking_tag_list_backfill", (
+        # any-of (&&) and all-of (@>) tag filters
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_bookings_tag_list ON bookings USING gin (tag_list)",
+    ), transactional=False, backfill=Backfill(
+        "bookings",
+        "UPDATE bookings SET tag_list = coalesce(array_remove(string_to_array(tags, ','), ''), '{}') "
+        "WHERE id > $1 AND id <= $2 AND tag_list IS NULL",
+    )),
+    Migration(7, "booking_rollups", (
+        """CREATE TABLE IF NOT EXISTS booking_rollups (
+            restaurant_id INTEGER NOT NULL REFERENCES restaurants (id) ON DELETE CASCADE,
+            date DATE NOT NULL,
+            time_slot VARCHAR(10) NOT NULL,
+            bookings INTEGER NOT NULL DEFAULT 0,
+            guests INTEGER NOT NULL DEFAULT 0,
+            deposits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (restaurant_id, date, time_slot)
+        )""",
+        # initial fill; bookings committed while this runs are picked up by the rebuild job
+        "INSERT INTO booking_rollups (restaurant_id, date, time_slot, bookings, guests, deposits) "
+        "SELECT restaurant_id, date, time_slot, count(*), sum(coalesce(guest_count, 1)), count(*) FILTER (WHERE deposit) "
+        "FROM bookings GROUP BY restaurant_id, date, time_slot "
+        "ON CONFLICT DO NOTHING",
+    )),
+    # filled by writers and the rollup rebuild; older days: python -m app.rollups --from ... --to ...
+    Migration(8, "booking_rollup_table_minutes", (
+        "ALTER TABLE booking_rollups ADD COLUMN IF NOT EXISTS table_minutes INTEGER NOT NULL DEFAULT 0",
+    )),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+_CONCURRENT_INDEX_RE = re.compile(r"CREATE\s+INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE)
+
+
+async def _current_version(conn) -> int:
+    exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", SCHEMA_TABLE)
+    if not exists:
+        return 0
+    return await conn.fetchval(f"SELECT coalesce(max(version), 0) FROM {SCHEMA_TABLE}")
+
+
+async def _drop_invalid_index(conn, statement: str) -> None:
+    # an interrupted CONCURRENTLY build leaves an INVALID index that IF NOT EXISTS would keep
+    match = _CONCURRENT_INDEX_RE.match(statement.strip())
+    if match is None:
+        return
+    invalid = await conn.fetchval(
+        "SELECT NOT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = $1 AND c.relnamespace = 'public'::regnamespace",
+        match.group(1),
+    )
+    if invalid:
+        logger.warning("dropping invalid index %s left by an interrupted migration", match.group(1))
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {match.group(1)}")
+
+
+async def _backfill(conn, backfill: Backfill) -> None:
+    # short row locks per batch; a re-run after a failure skips the filled rows quickly
+    last_id = await conn.fetchval(f"SELECT max(id) FROM {backfill.table}") or 0
+    total = 0
+    for low in range(0, last_id, backfill.batch_rows):
+        status = await conn.execute(backfill.statement, low, low + backfill.batch_rows)
+        total += int(status.rsplit(" ", 1)[-1])
+    logger.info("backfilled %d rows of %s", total, backfill.table)
+
+
+async def _apply(conn, migration: Migration) -> None:
+    record = f"INSERT INTO {SCHEMA_TABLE} (version, name) VALUES ($1, $2)"
+    # give up instead of queueing behind a long transaction (and blocking traffic queued behind us)
+    lock_timeout = f"lock_timeout = '{int(settings.MIGRATION_LOCK_TIMEOUT_SECONDS * 1000)}ms'"
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL {lock_timeout}")
+            for statement in migration.statements:
+                await conn.execute(statement)
+            await conn.execute(record, migration.version, migration.name)
+        return
+    await conn.execute(f"SET {lock_timeout}")
+    try:
+        if migration.backfill:
+            await _backfill(conn, migration.backfill)
+        for statement in migration.statements:
+            await _drop_invalid_index(conn, statement)
+            await conn.execute(statement)
+    finally:
+        await conn.execute("RESET lock_timeout")
+    await conn.execute(record, migration.version, migration.name)
+
+
+async def migrate(target: Optional[AsyncEngine] = None) -> List[int]:
+    """Apply pending migrations; returns the versions applied by this process.
+
+    Returns right away when the schema is current or another process is migrating.
+    """
+    target = target or engine
+    async with target.connect() as sa_conn:
+        raw = await sa_conn.get_raw_connection()
+        # asyncpg directly: explicit transactions, and CONCURRENTLY outside of one
+        conn = raw.driver_connection
+        if await _current_version(conn) >= LATEST_VERSION:
+            return []
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", MIGRATION_LOCK_KEY):
+            logger.info("another process is migrating the schema, not waiting for it")
+            return []
+        applied: List[int] = []
+        try:
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {SCHEMA_TABLE} ("
+                "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+            )
+            # re-read under the lock: a process that just finished may have applied them
+            current = await _current_version(conn)
+            for migration in MIGRATIONS:
+                if migration.version <= current:
+                    continue
+                started = time.monotonic()
+                await _apply(conn, migration)
+                applied.append(migration.version)
+                logger.info(
+                    "applied migration %04d_%s in %.2fs", migration.version, migration.name, time.monotonic() - started
+                )
+        finally:
+            await conn.fetchval("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_KEY)
+    return applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    versions = asyncio.run(migrate())
+    print(f"applied migrations: {versions}" if versions else "nothing to apply (schema current or another process is migrating)")
@@ -1,4 +1,5 @@
-from sqlalchemy import ForeignKey, Integer, String, Date, UniqueConstraint, Text, Boolean
+from sqlalchemy import ForeignKey, Integer, String, Date, UniqueConstraint, Text, Boolean, Index, func, literal_column
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
@@ -10,6 +11,12 @@ class Restaurant(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     default_table_count: Mapped[int] = mapped_column(Integer, nullable=False, default=5)
+    # Schedule: slots every slot_minutes from open_time until close_time (after midnight if
+    # not later than open_time); a booking without an end time holds a table booking_minutes
+    open_time: Mapped[str] = mapped_column(String(5), nullable=False, default="12:00", server_default="12:00")
+    close_time: Mapped[str] = mapped_column(String(5), nullable=False, default="23:00", server_default="23:00")
+    slot_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=60, server_default="60")
+    booking_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=60, server_default="60")
 
     bookings: Mapped[list["Booking"]] = relationship("Booking", back_populates="restaurant")
 
@@ -18,6 +25,17 @@ class Booking(Base):
     __tablename__ = "bookings"
     __table_args__ = (
         UniqueConstraint("restaurant_id", "date", "time_slot", "client_name", name="uq_booking_dedup"),
+        # day views and keyset pagination order by (date, time_slot, id) within a restaurant
+        Index("ix_bookings_restaurant_date_slot_id", "restaurant_id", "date", "time_slot", "id"),
+        # substring/prefix search on guest name (ILIKE), needs the pg_trgm extension
+        Index(
+            "ix_bookings_client_name_trgm",
+            "client_name",
+            postgresql_using="gin",
+            postgresql_ops={"client_name": "gin_trgm_ops"},
+        ),
+        # any-of (&&) / all-of (@>) tag filters
+        Index("ix_bookings_tag_list", "tag_list", postgresql_using="gin"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -31,12 +49,67 @@ class Booking(Base):
     phone: Mapped[str | None] = mapped_column(String(32), nullable=True)
     guest_count: Mapped[int | None] = mapped_column(Integer, nullable=True)
     comment: Mapped[str | None] = mapped_column(Text, nullable=True)
-    tags: Mapped[str | None] = mapped_column(Text, nullable=True)  # JSON-encoded list of strings
+    # Comma-joined copy of tag_list, still written for workers and exports of older releases
+    tags: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # NULL only on rows the tag_list backfill migration has not reached yet
+    tag_list: Mapped[list[str] | None] = mapped_column(ARRAY(Text), nullable=True)
     deposit: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
 
     restaurant: Mapped[Restaurant] = relationship("Restaurant", back_populates="bookings")
 
 
+def booking_tags(booking: Booking) -> list[str]:
+    if booking.tag_list is not None:
+        return list(booking.tag_list)
+    return booking.tags.split(",") if booking.tags else []
+
+
+def phone_digits(column):
+    """Phone number reduced to digits; queries must use this exact expression to hit the index."""
+    return func.regexp_replace(column, literal_column("'[^0-9]'"), literal_column("''"), literal_column("'g'"))
+
+
+# returning-guest lookup by phone regardless of formatting
+Index("ix_bookings_restaurant_phone_digits", Booking.restaurant_id, phone_digits(Booking.phone))
+
+
+class RestaurantTable(Base):
+    """A physical table; tables sharing a combine_group can be pushed together for large parties."""
+
+    __tablename__ = "restaurant_tables"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id", ondelete="CASCADE"), nullable=False, index=True)
+    name: Mapped[str] = mapped_column(String(64), nullable=False)
+    seats: Mapped[int] = mapped_column(Integer, nullable=False)
+    combine_group: Mapped[str | None] = mapped_column(String(64), nullable=True)
+
+
+class BookingTable(Base):
+    """Tables a booking is seated at; more than one when tables are combined."""
+
+    __tablename__ = "booking_tables"
+
+    booking_id: Mapped[int] = mapped_column(ForeignKey("bookings.id", ondelete="CASCADE"), primary_key=True)
+    table_id: Mapped[int] = mapped_column(ForeignKey("restaurant_tables.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class BookingRollup(Base):
+    """Booking totals per restaurant, day and start slot, and tables in use per slot, for reporting."""
+
+    __tablename__ = "booking_rollups"
+
+    restaurant_id: Mapped[int] = mapped_column(ForeignKey("restaurants.id", ondelete="CASCADE"), primary_key=True)
+    date: Mapped[Date] = mapped_column(Date, primary_key=True)
+    time_slot: Mapped[str] = mapped_column(String(10), primary_key=True)
+    bookings: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # a booking without guest_count counts as one guest, as in seating
+    guests: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    deposits: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # table-minutes held during the slot by bookings of any start, combined tables counted each
+    table_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
 class RestaurantSettings(Base):
     __tablename__ = "restaurant_settings"
 
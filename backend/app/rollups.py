@@ -0,0 +1,140 @@
+"""Booking totals per restaurant, day and start slot (booking_rollups).
+
+Writers add their new bookings in the same transaction (add_to_rollups) and
+store the table-minutes of each slot of the days they hold locked from the
+day's occupancy (set_table_minutes), so reports never scan bookings. rebuild_rollups recomputes days from bookings
+to repair drift, e.g. from workers of an older release; it runs
+periodically for recent and upcoming days and on demand:
+
+    python -m app.rollups --from 2025-01-01 --to 2025-12-31 [--restaurant 1]
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .availability import DayOccupancy, Schedule, load_occupancy
+from .db import AsyncSessionLocal
+from .models import Booking, BookingRollup, Restaurant
+from .slots import lock_days
+
+
+logger = logging.getLogger(__name__)
+
+# days rebuilt per transaction; their day locks are held until it commits
+REBUILD_CHUNK_DAYS = 31
+
+
+async def add_to_rollups(db: AsyncSession, bookings: Iterable[Mapping[str, Any]]) -> None:
+    """Count new bookings (booking column values) in their rollup rows; one upsert statement."""
+    totals: Dict[Tuple[int, date, str], List[int]] = {}
+    for b in bookings:
+        row = totals.setdefault((b["restaurant_id"], b["date"], b["time_slot"]), [0, 0, 0])
+        row[0] += 1
+        row[1] += b.get("guest_count") or 1
+        row[2] += 1 if b.get("deposit") else 0
+    if not totals:
+        return
+    stmt = insert(BookingRollup).values([
+        {"restaurant_id": rid, "date": day, "time_slot": slot, "bookings": n, "guests": guests, "deposits": deposits}
+        # key order, so concurrent writers lock the rows in the same order
+        for (rid, day, slot), (n, guests, deposits) in sorted(totals.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BookingRollup.restaurant_id, BookingRollup.date, BookingRollup.time_slot],
+        set_={
+            "bookings": BookingRollup.bookings + stmt.excluded.bookings,
+            "guests": BookingRollup.guests + stmt.excluded.guests,
+            "deposits": BookingRollup.deposits + stmt.excluded.deposits,
+        },
+    )
+    await db.execute(stmt)
+
+
+async def set_table_minutes(db: AsyncSession, restaurant_id: int, occupancy: Mapping[date, DayOccupancy]) -> None:
+    """Store per-slot table-minutes of whole days, computed under their day locks; one upsert statement."""
+    rows = [
+        {"restaurant_id": restaurant_id, "date": day, "time_slot": slot, "table_minutes": minutes}
+        for day in sorted(occupancy)
+        for slot, minutes in sorted(occupancy[day].slot_usage().items())
+    ]
+    if not rows:
+        return
+    stmt = insert(BookingRollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BookingRollup.restaurant_id, BookingRollup.date, BookingRollup.time_slot],
+        set_={"table_minutes": stmt.excluded.table_minutes},
+    )
+    await db.execute(stmt)
+
+
+def _totals_from_bookings(restaurant_id: int, date_from: date, date_to: date):
+    """SELECT of rollup rows computed from bookings, in booking_rollups column order."""
+    return (
+        select(
+            Booking.restaurant_id,
+            Booking.date,
+            Booking.time_slot,
+            func.count(),
+            func.sum(func.coalesce(Booking.guest_count, 1)),
+            func.count().filter(Booking.deposit),
+        )
+        .where(Booking.restaurant_id == restaurant_id, Booking.date >= date_from, Booking.date <= date_to)
+        .group_by(Booking.restaurant_id, Booking.date, Booking.time_slot)
+    )
+
+
+async def rebuild_rollups(db: AsyncSession, restaurant_id: int, date_from: date, date_to: date) -> None:
+    """Recompute the rollups of a day range from bookings; the caller commits."""
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        return
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+    # the same day locks as booking writers, so no booking lands between delete and insert
+    await lock_days(db, restaurant_id, days)
+    await db.execute(
+        delete(BookingRollup).where(
+            BookingRollup.restaurant_id == restaurant_id,
+            BookingRollup.date >= date_from,
+            BookingRollup.date <= date_to,
+        )
+    )
+    await db.execute(
+        insert(BookingRollup).from_select(
+            ["restaurant_id", "date", "time_slot", "bookings", "guests", "deposits"],
+            _totals_from_bookings(restaurant_id, date_from, date_to),
+        )
+    )
+    # on the current slot grid and seating, like the writers
+    occupancy = await load_occupancy(db, restaurant_id, Schedule.of(restaurant), days)
+    await set_table_minutes(db, restaurant_id, occupancy)
+
+
+async def rebuild_all(date_from: date, date_to: date, restaurant_ids: Optional[List[int]] = None) -> None:
+    """Rebuild a day range for every (or the given) restaurant, a month per transaction."""
+    async with AsyncSessionLocal() as db:
+        if restaurant_ids is None:
+            restaurant_ids = list((await db.execute(select(Restaurant.id).order_by(Restaurant.id))).scalars())
+        for rid in restaurant_ids:
+            start = date_from
+            while start <= date_to:
+                end = min(start + timedelta(days=REBUILD_CHUNK_DAYS - 1), date_to)
+                await rebuild_rollups(db, rid, start, end)
+                await db.commit()
+                start = end + timedelta(days=1)
+    logger.info("rebuilt rollups %s..%s for %d restaurants", date_from, date_to, len(restaurant_ids))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+    parser = argparse.ArgumentParser(prog="python -m app.rollups", description="Rebuild booking rollups from bookings")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, required=True)
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, required=True)
+    parser.add_argument("--restaurant", type=int, action="append", help="restaurant id; all when omitted")
+    args = parser.parse_args()
+    asyncio.run(rebuild_all(args.date_from, args.date_to, args.restaurant))
@@ -4,6 +4,8 @@ from .auth import router as auth_router
 from .bookings import router as bookings_router
 from .restaurants import router as restaurants_router
 from .assistants import router as assistants_router
+from .metrics import router as metrics_router
+from .analytics import router as analytics_router
 
 
 api_router = APIRouter()
@@ -11,4 +13,6 @@ api_router.include_router(auth_router, prefix="/auth", tags=["auth"])
 api_router.include_router(bookings_router, prefix="/bookings", tags=["bookings"])
 api_router.include_router(restaurants_router, prefix="/restaurants", tags=["restaurants"])
 api_router.include_router(assistants_router, prefix="/assistants", tags=["assistants"])
+api_router.include_router(analytics_router, prefix="/analytics", tags=["analytics"])
+api_router.include_router(metrics_router, tags=["metrics"])
 
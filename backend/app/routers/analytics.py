@@ -0,0 +1,121 @@
+from collections import Counter
+from datetime import date, timedelta
+from itertools import product
+from typing import Any, Dict, List, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import Integer, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..auth import get_current_user
+from ..availability import Schedule
+from ..cache import get_cached_report, set_cached_report
+from ..config import settings
+from ..db import get_db
+from ..models import BookingRollup, Restaurant
+from ..schemas import OccupancyReport, OccupancyRow
+
+
+router = APIRouter()
+
+_WEEKDAY = func.extract("isodow", BookingRollup.date).cast(Integer)
+
+# group_by -> dimensions of a row
+GROUPINGS: Dict[str, Tuple[str, ...]] = {
+    "weekday_slot": ("weekday", "time_slot"),
+    "weekday": ("weekday",),
+    "slot": ("time_slot",),
+    "day": ("day",),
+    "day_slot": ("day", "time_slot"),
+}
+_COLUMNS = {"day": BookingRollup.date, "weekday": _WEEKDAY, "time_slot": BookingRollup.time_slot}
+
+
+@router.get("/{restaurant_id}/occupancy", response_model=OccupancyReport)
+async def occupancy_report(
+    restaurant_id: int,
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    group_by: str = Query(default="weekday_slot", pattern=f"^({'|'.join(GROUPINGS)})$"),
+    _: dict = Depends(get_current_user),
+    # primary, like other reads that fill a cache; the rollup query is small
+    db: AsyncSession = Depends(get_db),
+):
+    if date_to < date_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'to' must not be before 'from'")
+    span = (date_to - date_from).days + 1
+    if span > settings.ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Range is limited to {settings.ANALYTICS_MAX_DAYS} days")
+
+    report_key = f"occupancy:{group_by}:{date_from}:{date_to}"
+    cached = await get_cached_report(restaurant_id, report_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+    schedule = Schedule.of(restaurant)
+
+    # at most days x slots rollup rows, summed in Postgres
+    dims = GROUPINGS[group_by]
+    columns = [_COLUMNS[d] for d in dims]
+    result = await db.execute(
+        select(
+            *columns,
+            func.sum(BookingRollup.bookings),
+            func.sum(BookingRollup.guests),
+            func.sum(BookingRollup.deposits),
+            func.sum(BookingRollup.table_minutes),
+        )
+        .where(
+            BookingRollup.restaurant_id == restaurant_id,
+            BookingRollup.date >= date_from,
+            BookingRollup.date <= date_to,
+        )
+        .group_by(*columns)
+    )
+    totals = {tuple(row[:len(dims)]): row[len(dims):] for row in result.all()}
+
+    # every group of the range, not only those with bookings, so empty slots average in as zero
+    days = [date_from + timedelta(days=i) for i in range(span)]
+    weekday_days = Counter(d.isoweekday() for d in days)
+    slots = schedule.slot_times()
+    # table-minutes a group offers per day: one slot, or every slot of the service day
+    capacity = schedule.tables * schedule.slot_minutes * (1 if "time_slot" in dims else len(slots))
+    slots += sorted({key[dims.index("time_slot")] for key in totals} - set(slots)) if "time_slot" in dims else []
+    values: Dict[str, List[Any]] = {"day": days, "weekday": sorted(weekday_days), "time_slot": slots}
+
+    rows: List[OccupancyRow] = []
+    for key in product(*(values[d] for d in dims)):
+        group = dict(zip(dims, key))
+        if "day" in group:
+            group_days = 1
+        elif "weekday" in group:
+            group_days = weekday_days[group["weekday"]]
+        else:
+            group_days = span
+        bookings, guests, deposits, table_minutes = (int(v or 0) for v in totals.get(key, (0, 0, 0, 0)))
+        avg_bookings = bookings / group_days
+        rows.append(OccupancyRow(
+            **group,
+            days=group_days,
+            bookings=bookings,
+            guests=guests,
+            deposits=deposits,
+            table_minutes=table_minutes,
+            avg_bookings=round(avg_bookings, 3),
+            avg_guests=round(guests / group_days, 3),
+            occupancy=round(table_minutes / group_days / capacity, 4) if capacity else None,
+        ))
+
+    body = OccupancyReport(
+        restaurant_id=restaurant_id,
+        date_from=date_from,
+        date_to=date_to,
+        group_by=group_by,
+        tables=schedule.tables,
+        rows=rows,
+    ).model_dump_json()
+    await set_cached_report(restaurant_id, report_key, body)
+    return Response(content=body, media_type="application/json")
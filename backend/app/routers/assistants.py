@@ -1,14 +1,18 @@
-import asyncio
 import json
 from typing import Any, Dict, Optional
 
-import httpx
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
 
+from ..answer_cache import get_answer, get_settings_version, store_answer
 from ..auth import get_current_user
 from ..config import settings
+from ..db import get_db
+from ..run_tracker import admission, run_tracker
 from ..schemas import AssistantChatRequest, AssistantChatResponse
+from ..upstream import upstream_events, upstream_request
 
 
 router = APIRouter()
@@ -24,23 +28,24 @@ async def _assistants_headers() -> Dict[str, str]:
     }
 
 
-async def _create_thread(client: httpx.AsyncClient) -> str:
-    resp = await client.post(f"{settings.OPENAI_BASE_URL}/threads", json={})
-    resp.raise_for_status()
+async def _create_thread(headers: Dict[str, str], messages: list[Dict[str, str]] | None = None) -> str:
+    body: Dict[str, Any] = {"messages": messages} if messages else {}
+    resp = await upstream_request("POST", "/threads", headers=headers, json=body)
     data = resp.json()
     return data["id"]
 
 
-async def _add_message(client: httpx.AsyncClient, thread_id: str, content: str) -> None:
-    resp = await client.post(
-        f"{settings.OPENAI_BASE_URL}/threads/{thread_id}/messages",
+async def _add_message(headers: Dict[str, str], thread_id: str, content: str) -> None:
+    await upstream_request(
+        "POST",
+        f"/threads/{thread_id}/messages",
+        headers=headers,
         json={"role": "user", "content": content},
     )
-    resp.raise_for_status()
 
 
 async def _create_run(
-    client: httpx.AsyncClient,
+    headers: Dict[str, str],
     thread_id: str,
     assistant_id: str,
     instructions: str | None = None,
@@ -48,33 +53,12 @@ async def _create_run(
     body: Dict[str, Any] = {"assistant_id": assistant_id}
     if instructions:
         body["instructions"] = instructions
-    resp = await client.post(
-        f"{settings.OPENAI_BASE_URL}/threads/{thread_id}/runs",
-        json=body,
-    )
-    resp.raise_for_status()
+    resp = await upstream_request("POST", f"/threads/{thread_id}/runs", headers=headers, json=body)
     return resp.json()["id"]
 
 
-async def _wait_run_complete(client: httpx.AsyncClient, thread_id: str, run_id: str, timeout_s: float = 30.0) -> None:
-    waited = 0.0
-    interval = 0.5
-    while waited < timeout_s:
-        resp = await client.get(f"{settings.OPENAI_BASE_URL}/threads/{thread_id}/runs/{run_id}")
-        resp.raise_for_status()
-        st = resp.json().get("status")
-        if st in ("completed", "failed", "cancelled", "expired"):
-            if st != "completed":
-                raise HTTPException(status_code=500, detail=f"Assistant run status: {st}")
-            return
-        await asyncio.sleep(interval)
-        waited += interval
-    raise HTTPException(status_code=504, detail="Assistant run timeout")
-
-
-async def _get_last_assistant_message(client: httpx.AsyncClient, thread_id: str) -> str:
-    resp = await client.get(f"{settings.OPENAI_BASE_URL}/threads/{thread_id}/messages", params={"limit": 10, "order": "desc"})
-    resp.raise_for_status()
+async def _get_last_assistant_message(headers: Dict[str, str], thread_id: str) -> str:
+    resp = await upstream_request("GET", f"/threads/{thread_id}/messages", headers=headers, params={"limit": 10, "order": "desc"})
     data = resp.json()
     for msg in data.get("data", []):
         if msg.get("role") == "assistant":
@@ -90,84 +74,150 @@ async def _get_last_assistant_message(client: httpx.AsyncClient, thread_id: str)
     return ""
 
 
+def _message_delta_text(event: Dict[str, Any], seen_parts: set) -> str:
+    """Text carried by a thread.message.delta event; separate content parts like _get_last_assistant_message."""
+    texts = []
+    message_id = event.get("id")
+    for part in event.get("delta", {}).get("content", []):
+        if part.get("type") != "text":
+            continue
+        val = part.get("text", {}).get("value")
+        if not val:
+            continue
+        key = (message_id, part.get("index", 0))
+        if key not in seen_parts:
+            if seen_parts:
+                val = "\n\n" + val
+            seen_parts.add(key)
+        texts.append(val)
+    return "".join(texts)
+
+
+def _stream_error_message(data: str) -> str:
+    try:
+        return json.loads(data).get("message") or "error"
+    except (ValueError, AttributeError):
+        return data or "error"
+
+
+async def _cached_answer_version(req: AssistantChatRequest, restaurant_id: int, db: AsyncSession) -> Optional[str]:
+    """Settings version to key the answer cache on, or None when this request must not use it."""
+    # only fresh conversations: an existing thread carries context the cached answer did not see
+    if not req.use_cache or req.thread_id:
+        return None
+    return await get_settings_version(db, restaurant_id)
+
+
+async def _thread_from_cache(headers: Dict[str, str], question: str, answer: str) -> str:
+    # one upstream call records the exchange so the conversation can continue on this thread
+    return await _create_thread(headers, [
+        {"role": "user", "content": question},
+        {"role": "assistant", "content": answer},
+    ])
+
+
 @router.post("/chat", response_model=AssistantChatResponse)
-async def assistant_chat(req: AssistantChatRequest, _: dict = Depends(get_current_user)):
+async def assistant_chat(
+    req: AssistantChatRequest,
+    user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
     headers = await _assistants_headers()
-    async with httpx.AsyncClient(headers=headers, timeout=60) as client:
-        thread_id = req.thread_id or await _create_thread(client)
-        await _add_message(client, thread_id, req.message)
-        run_id = await _create_run(client, thread_id, req.assistant_id)
-        await _wait_run_complete(client, thread_id, run_id)
-        answer = await _get_last_assistant_message(client, thread_id)
-        return AssistantChatResponse(thread_id=thread_id, assistant_message=answer)
+    restaurant_id = int(user.get("restaurant_id", 0))
+    cache_version = await _cached_answer_version(req, restaurant_id, db)
+    if cache_version is not None:
+        cached = await get_answer(restaurant_id, req.assistant_id, req.message, cache_version)
+        if cached is not None:
+            thread_id = await _thread_from_cache(headers, req.message, cached)
+            return AssistantChatResponse(thread_id=thread_id, assistant_message=cached)
+
+    async with admission.slot(restaurant_id):
+        thread_id = req.thread_id or await _create_thread(headers)
+        await _add_message(headers, thread_id, req.message)
+        run_id = await _create_run(headers, thread_id, req.assistant_id)
+        st = await run_tracker.wait(headers, thread_id, run_id, settings.ASSISTANT_RUN_TIMEOUT_SECONDS)
+        if st != "completed":
+            raise HTTPException(status_code=500, detail=f"Assistant run status: {st}")
+        answer = await _get_last_assistant_message(headers, thread_id)
+    if cache_version is not None:
+        await store_answer(restaurant_id, req.assistant_id, req.message, cache_version, answer)
+    return AssistantChatResponse(thread_id=thread_id, assistant_message=answer)
 
 
 @router.post("/chat_stream")
-async def assistant_chat_stream(req: AssistantChatRequest, _: dict = Depends(get_current_user)):
+async def assistant_chat_stream(
+    req: AssistantChatRequest,
+    user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
     headers = await _assistants_headers()
+    restaurant_id = int(user.get("restaurant_id", 0))
+    cache_version = await _cached_answer_version(req, restaurant_id, db)
+    cached = None
+    if cache_version is not None:
+        cached = await get_answer(restaurant_id, req.assistant_id, req.message, cache_version)
+
+    async def cached_generator():
+        thread_id = None
+        try:
+            thread_id = await _thread_from_cache(headers, req.message, cached)
+            yield f"data: {json.dumps({ 'thread_id': thread_id })}\n\n"
+            yield f"data: {json.dumps({ 'delta': cached })}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({ 'error': str(e) })}\n\n"
+        payload: Dict[str, Any] = { 'done': True }
+        if thread_id:
+            payload['thread_id'] = thread_id
+        yield f"data: {json.dumps(payload)}\n\n"
+
+    if cached is not None:
+        return StreamingResponse(cached_generator(), media_type="text/event-stream", headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        })
+
+    # Admit before responding so overload is a plain 503; the slot is released once the stream ends
+    await admission.acquire(restaurant_id)
 
     async def event_generator():
-        async with httpx.AsyncClient(headers=headers, timeout=60) as client:
-            try:
-                thread_id = req.thread_id or await _create_thread(client)
-                yield f"data: {json.dumps({ 'thread_id': thread_id })}\n\n"
-                await _add_message(client, thread_id, req.message)
-                run_id = await _create_run(client, thread_id, req.assistant_id)
-
-                accumulated = ""
-                while True:
-                    # Check run state
-                    resp = await client.get(f"{settings.OPENAI_BASE_URL}/threads/{thread_id}/runs/{run_id}")
-                    resp.raise_for_status()
-                    st = resp.json().get("status")
-
-                    # Read latest assistant text
-                    msg_resp = await client.get(
-                        f"{settings.OPENAI_BASE_URL}/threads/{thread_id}/messages",
-                        params={"limit": 1, "order": "desc"},
-                    )
-                    msg_resp.raise_for_status()
-                    data = msg_resp.json()
-                    latest_text = ""
-                    if data.get("data"):
-                        msg = data["data"][0]
-                        if msg.get("role") == "assistant":
-                            parts = msg.get("content", [])
-                            chunks = []
-                            for p in parts:
-                                if p.get("type") == "text":
-                                    val = p.get("text", {}).get("value")
-                                    if val:
-                                        chunks.append(val)
-                            latest_text = "\n\n".join(chunks)
-
-                    if len(latest_text) > len(accumulated):
-                        delta = latest_text[len(accumulated):]
-                        accumulated = latest_text
-                        # send delta
+        thread_id = None
+        answer: list[str] = []
+        failed = False
+        try:
+            thread_id = req.thread_id or await _create_thread(headers)
+            yield f"data: {json.dumps({ 'thread_id': thread_id })}\n\n"
+            await _add_message(headers, thread_id, req.message)
+
+            # Relay text deltas as the upstream run produces them
+            seen_parts: set = set()
+            body = {"assistant_id": req.assistant_id, "stream": True}
+            async for event, data in upstream_events(f"/threads/{thread_id}/runs", headers=headers, json=body):
+                if event == "thread.message.delta":
+                    delta = _message_delta_text(json.loads(data), seen_parts)
+                    if delta:
+                        answer.append(delta)
                         yield f"data: {json.dumps({ 'delta': delta })}\n\n"
-
-                    if st in ("completed", "failed", "cancelled", "expired"):
-                        if st != "completed":
-                            yield f"data: {json.dumps({ 'error': st })}\n\n"
-                        break
-                    await asyncio.sleep(0.5)
-            except Exception as e:
-                yield f"data: {json.dumps({ 'error': str(e) })}\n\n"
-            finally:
-                # final event
-                try:
-                    # thread_id may not exist if error before creation
-                    tid = locals().get('thread_id', None)
-                    payload = { 'done': True }
-                    if tid:
-                        payload['thread_id'] = tid
-                    yield f"data: {json.dumps(payload)}\n\n"
-                except Exception:
-                    pass
+                elif event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired"):
+                    failed = True
+                    yield f"data: {json.dumps({ 'error': event.rsplit('.', 1)[-1] })}\n\n"
+                elif event == "error":
+                    failed = True
+                    yield f"data: {json.dumps({ 'error': _stream_error_message(data) })}\n\n"
+                elif event == "done":
+                    break
+            if cache_version is not None and not failed:
+                await store_answer(restaurant_id, req.assistant_id, req.message, cache_version, "".join(answer))
+        except Exception as e:
+            yield f"data: {json.dumps({ 'error': str(e) })}\n\n"
+
+        # final event; thread_id is missing if creating the thread failed
+        payload: Dict[str, Any] = { 'done': True }
+        if thread_id:
+            payload['thread_id'] = thread_id
+        yield f"data: {json.dumps(payload)}\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream", headers={
         "Cache-Control": "no-cache",
         "Connection": "keep-alive",
-    })
+    }, background=BackgroundTask(admission.release, restaurant_id))
 
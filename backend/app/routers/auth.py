@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.security import HTTPAuthorizationCredentials
 
-from ..auth import create_access_token
+from ..auth import create_access_token, get_current_user, revoke_token, security
 from ..config import settings
 from ..schemas import LoginRequest, TokenResponse
 
@@ -17,3 +18,13 @@ async def login(payload: LoginRequest):
     access_token = create_access_token(subject=payload.username, restaurant_id=1)
     return TokenResponse(access_token=access_token)
 
+
+@router.post("/logout", status_code=204)
+async def logout(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    user: dict = Depends(get_current_user),
+):
+    if not settings.JWT_REVOCATION_ENABLED:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Token revocation is disabled")
+    await revoke_token(credentials.credentials, user)
+    return Response(status_code=204)
@@ -1,23 +1,252 @@
-from datetime import datetime
-from typing import Dict, List
+import base64
+import json
+import logging
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import Select, func, select
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from redis.exceptions import RedisError
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..auth import get_current_user
-from ..cache import get_cached_slots, set_cached_slots
+from ..availability import DayOccupancy, Schedule
+from ..cache import (
+    CachedSlots,
+    get_cached_slots_many,
+    get_or_load_slots,
+    needs_refresh,
+    pin_to_primary,
+    refresh_slots_in_background,
+    set_cached_slots_many,
+    write_through_slots,
+)
 from ..config import settings
-from ..db import get_db
-from ..models import Booking, Restaurant
-from ..schemas import BookingCreate, SlotInfo, SlotsResponse
+from ..db import get_db, get_read_db
+from ..exporter import stream_bookings
+from ..group_commit import booking_values, group_committer
+from ..importer import import_bookings
+from ..models import Booking, Restaurant, booking_tags, phone_digits
+from ..rollups import add_to_rollups, set_table_minutes
+from ..schemas import (
+    BookingCreate,
+    BookingOut,
+    BookingPage,
+    DaySlots,
+    DayTagCounts,
+    ImportReport,
+    SeatAssignment,
+    SeatingPlanOut,
+    SlotInfo,
+    SlotsRangeResponse,
+    SlotsResponse,
+    TagCountsResponse,
+)
+from ..seating import (
+    NoCapacity,
+    SeatingPlan,
+    load_day_books,
+    load_seating,
+    load_tables,
+    optimise,
+    save_assignments,
+)
+from ..slots import count_bookings, lock_days
+from ..utils import etag_matches
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 
+@router.get("/{restaurant_id}", response_model=SlotsRangeResponse)
+async def get_slots_range(
+    restaurant_id: int,
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    if date_to < date_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'to' must not be before 'from'")
+    span = (date_to - date_from).days + 1
+    if span > settings.SLOTS_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Range is limited to {settings.SLOTS_RANGE_MAX_DAYS} days")
+
+    days = [date_from + timedelta(days=i) for i in range(span)]
+    cached = await get_cached_slots_many(restaurant_id, [d.isoformat() for d in days])
+    missing = [d for d in days if cached.get(d.isoformat()) is None]
+    for d in days:
+        hit = cached.get(d.isoformat())
+        if hit is not None and needs_refresh(hit):
+            refresh_slots_in_background(restaurant_id, d.isoformat(), d, hit)
+
+    if missing:
+        restaurant = await db.get(Restaurant, restaurant_id)
+        if restaurant is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+        counts = {d.isoformat(): c for d, c in (await count_bookings(db, restaurant, missing)).items()}
+        cached.update(await set_cached_slots_many(restaurant_id, counts, restaurant.default_table_count))
+
+    return SlotsRangeResponse(
+        restaurant_id=restaurant_id,
+        days=[DaySlots(date=d, slots=[SlotInfo(**s) for s in cached[d.isoformat()].slots]) for d in days],
+    )
+
+
+def _encode_cursor(booking: Booking) -> str:
+    raw = json.dumps([booking.date.isoformat(), booking.time_slot, booking.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[date, str, int]:
+    try:
+        day, time_slot, booking_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return date.fromisoformat(day), str(time_slot), int(booking_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _booking_out(booking: Booking) -> BookingOut:
+    return BookingOut(
+        id=booking.id,
+        restaurant_id=booking.restaurant_id,
+        date=booking.date,
+        time_slot=booking.time_slot,
+        client_name=booking.client_name,
+        start_time=booking.start_time,
+        end_time=booking.end_time,
+        phone=booking.phone,
+        guest_count=booking.guest_count,
+        comment=booking.comment,
+        tags=booking_tags(booking),
+        deposit=booking.deposit,
+    )
+
+
+# Registered before /{restaurant_id}/{date} so "search" is not taken for a date
+@router.get("/{restaurant_id}/search", response_model=BookingPage)
+async def search_bookings(
+    restaurant_id: int,
+    phone: str | None = None,
+    name: str | None = None,
+    tag: list[str] = Query(default=[]),
+    tag_any: list[str] = Query(default=[]),
+    date_from: date | None = Query(default=None, alias="from"),
+    date_to: date | None = Query(default=None, alias="to"),
+    limit: int = Query(default=50, ge=1),
+    cursor: str | None = None,
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    limit = min(limit, settings.SEARCH_MAX_LIMIT)
+    stmt: Select = select(Booking).where(Booking.restaurant_id == restaurant_id)
+    if phone:
+        digits = re.sub(r"[^0-9]", "", phone)
+        if not digits:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Phone must contain digits")
+        stmt = stmt.where(phone_digits(Booking.phone) == digits)
+    if name:
+        pattern = name.replace("/", "//").replace("%", "/%").replace("_", "/_")
+        stmt = stmt.where(Booking.client_name.ilike(f"%{pattern}%", escape="/"))
+    # repeated tag= must all be present, repeated tag_any= at least one; both use the GIN index
+    if tag:
+        stmt = stmt.where(Booking.tag_list.contains(tag))
+    if tag_any:
+        stmt = stmt.where(Booking.tag_list.overlap(tag_any))
+    if date_from is not None:
+        stmt = stmt.where(Booking.date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Booking.date <= date_to)
+    if cursor:
+        stmt = stmt.where(tuple_(Booking.date, Booking.time_slot, Booking.id) > _decode_cursor(cursor))
+    stmt = stmt.order_by(Booking.date, Booking.time_slot, Booking.id).limit(limit + 1)
+
+    rows = (await db.execute(stmt)).scalars().all()
+    page = rows[:limit]
+    next_cursor = _encode_cursor(page[-1]) if len(rows) > limit else None
+    return BookingPage(items=[_booking_out(b) for b in page], next_cursor=next_cursor)
+
+
+@router.get("/{restaurant_id}/tags", response_model=TagCountsResponse)
+async def get_tag_counts(
+    restaurant_id: int,
+    date_from: date = Query(..., alias="from"),
+    date_to: date = Query(..., alias="to"),
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if date_to < date_from:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'to' must not be before 'from'")
+    span = (date_to - date_from).days + 1
+    if span > settings.TAG_COUNTS_MAX_DAYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Range is limited to {settings.TAG_COUNTS_MAX_DAYS} days")
+
+    # unnest and count in Postgres; only (day, tag, count) rows come back
+    tagged = (
+        select(Booking.date, func.unnest(Booking.tag_list).label("tag"))
+        .where(Booking.restaurant_id == restaurant_id, Booking.date >= date_from, Booking.date <= date_to)
+        .subquery()
+    )
+    rows = await db.execute(
+        select(tagged.c.date, tagged.c.tag, func.count())
+        .group_by(tagged.c.date, tagged.c.tag)
+        .order_by(tagged.c.date, tagged.c.tag)
+    )
+    days: dict[date, dict[str, int]] = {date_from + timedelta(days=i): {} for i in range(span)}
+    for day, tag, count in rows.all():
+        days[day][tag] = count
+    return TagCountsResponse(
+        restaurant_id=restaurant_id,
+        days=[DayTagCounts(date=day, counts=counts) for day, counts in days.items()],
+    )
+
+
+@router.get("/{restaurant_id}/export")
+async def export_bookings(
+    restaurant_id: int,
+    date_from: date | None = Query(default=None, alias="from"),
+    date_to: date | None = Query(default=None, alias="to"),
+    format: str = Query(default="csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+):
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+
+    filename = f"bookings_{restaurant_id}_{date_from or 'all'}_{date_to or 'all'}.{format}"
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        stream_bookings(restaurant_id, date_from, date_to, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def _slots_response(cached: CachedSlots, if_none_match: Optional[str]) -> Response:
+    """Serve the pre-rendered body; a matching If-None-Match gets an empty 304."""
+    headers = {"ETag": f'"{cached.version}"'} if cached.version else None
+    if etag_matches(if_none_match, cached.version):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+
 @router.get("/{restaurant_id}/{date}", response_model=SlotsResponse)
-async def get_slots(restaurant_id: int, date: str, _: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_slots(
+    restaurant_id: int,
+    date: str,
+    if_none_match: Optional[str] = Header(None),
+    _: dict = Depends(get_current_user),
+):
     try:
         date_str = date
         try:
@@ -25,99 +254,163 @@ async def get_slots(restaurant_id: int, date: str, _: dict = Depends(get_current
         except ValueError:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date format, expected YYYY-MM-DD")
         query_date = date_str  # keep as string for cache key
-        # Check cache first
-        cached = await get_cached_slots(restaurant_id, query_date)
-        if cached is not None:
-            return SlotsResponse(restaurant_id=restaurant_id, date=parsed_date, slots=[SlotInfo(**s) for s in cached])
-
-        # Build from DB
-        # Get restaurant to know default_table_count
-        restaurant = await db.get(Restaurant, restaurant_id)
-        if restaurant is None:
+        # Cache first; concurrent misses share one recomputation
+        cached = await get_or_load_slots(restaurant_id, query_date, parsed_date)
+        if cached is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
-
-        stmt: Select = (
-            select(Booking.time_slot, func.count(Booking.id))
-            .where(Booking.restaurant_id == restaurant_id)
-            .where(Booking.date == parsed_date)
-            .group_by(Booking.time_slot)
-        )
-        result = await db.execute(stmt)
-        counts: Dict[str, int] = {row[0]: int(row[1]) for row in result.all()}
-
-        slots: List[dict] = []
-        for t in settings.TIME_SLOTS:
-            booked = counts.get(t, 0)
-            free = max(restaurant.default_table_count - booked, 0)
-            slots.append({"time": t, "booked": booked, "free": free})
-
-        # Cache result
-        await set_cached_slots(restaurant_id, query_date, slots)
-
-        return SlotsResponse(restaurant_id=restaurant_id, date=parsed_date, slots=[SlotInfo(**s) for s in slots])
+        return _slots_response(cached, if_none_match)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+def _seating_out(restaurant_id: int, day: date, plan: SeatingPlan, **extra) -> SeatingPlanOut:
+    return SeatingPlanOut(
+        restaurant_id=restaurant_id,
+        date=day,
+        assignments=[SeatAssignment(booking_id=bid, table_ids=list(ids)) for bid, ids in plan.assigned.items()],
+        unseated=[bid for bid in plan.parties if bid not in plan.assigned],
+        spare_seats=plan.spare_seats(),
+        **extra,
+    )
+
+
+@router.get("/{restaurant_id}/{day}/seating", response_model=SeatingPlanOut)
+async def get_seating(restaurant_id: int, day: date, _: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+    tables = await load_tables(db, restaurant_id)
+    plan = await load_seating(db, restaurant_id, Schedule.of(restaurant), day, tables)
+    return _seating_out(restaurant_id, day, plan)
+
+
+@router.post("/{restaurant_id}/{day}/seating/optimize", response_model=SeatingPlanOut)
+async def optimize_seating(
+    restaurant_id: int,
+    day: date,
+    apply: bool = False,
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Re-seat the whole day from scratch; apply=true stores the new plan.
+
+    The plan is greedy and can fail to seat a booking the current plan seats;
+    such a plan is not applied (409).
+    """
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+    tables = await load_tables(db, restaurant_id)
+    if not tables:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Restaurant has no tables configured")
+    schedule = Schedule.of(restaurant)
+    if apply:
+        await lock_days(db, restaurant_id, [day])
+    current = await load_seating(db, restaurant_id, schedule, day, tables)
+    plan, _unseated = optimise(tables, current.parties.values())
+    changed = {bid: plan.assigned.get(bid, ()) for bid in plan.parties if plan.assigned.get(bid) != current.assigned.get(bid)}
+    unseated = sorted(bid for bid in current.assigned if bid not in plan.assigned)
+    if apply and unseated:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Optimised plan would unseat bookings {unseated}; current seating kept",
+        )
+    if apply and changed:
+        await save_assignments(db, changed)
+        occupancy = DayOccupancy(schedule, plan.intervals())
+        await set_table_minutes(db, restaurant_id, {day: occupancy})
+        await write_through_slots(restaurant_id, day, occupancy.slot_booked(), schedule.tables)
+        await db.commit()
+        await pin_to_primary(restaurant_id)
+    return _seating_out(restaurant_id, day, plan, applied=apply, moved=len(changed))
+
+
 @router.post("", status_code=201)
 async def create_booking(payload: BookingCreate, _: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if settings.BOOKING_GROUP_COMMIT:
+        # queued into a shared transaction with concurrent bookings; same responses
+        return await group_committer.submit(payload)
+
     # Ensure restaurant exists
     restaurant = await db.get(Restaurant, payload.restaurant_id)
     if restaurant is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
 
     # Check if time slot is valid
-    if payload.time_slot not in settings.TIME_SLOTS:
+    schedule = Schedule.of(restaurant)
+    if schedule.slot_start(payload.time_slot) is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid time slot")
+    try:
+        start, end = schedule.booking_interval(payload.time_slot, payload.start_time, payload.end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    # Count existing bookings
-    stmt: Select = (
-        select(func.count(Booking.id))
-        .where(Booking.restaurant_id == payload.restaurant_id)
-        .where(Booking.date == payload.date)
-        .where(Booking.time_slot == payload.time_slot)
-    )
-    result = await db.execute(stmt)
-    current_count = int(result.scalar() or 0)
-    if current_count >= restaurant.default_table_count:
-        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="No free tables for selected slot")
-
-    booking = Booking(
-        restaurant_id=payload.restaurant_id,
-        date=payload.date,
-        time_slot=payload.time_slot,
-        client_name=payload.client_name,
-        start_time=payload.start_time,
-        end_time=payload.end_time,
-        phone=payload.phone,
-        guest_count=payload.guest_count,
-        comment=payload.comment,
-        tags=','.join(payload.tags) if payload.tags else None,
-        deposit=bool(payload.deposit),
-    )
+    # A table must be free for the whole stay; the day lock serialises this check with other writers
+    await lock_days(db, restaurant.id, [payload.date])
+    book = (await load_day_books(db, restaurant.id, schedule, [payload.date]))[payload.date]
+    try:
+        # with a floor plan this also picks concrete tables for the party
+        table_ids, moves = book.reserve(-1, payload.guest_count or 1, start, end)
+    except NoCapacity as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+    values = booking_values(payload)
+    booking = Booking(**values)
     db.add(booking)
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Booking already exists")
+    if table_ids:
+        await save_assignments(db, {booking.id: table_ids, **dict(moves)})
+    await add_to_rollups(db, [values])
+    await set_table_minutes(db, restaurant.id, {payload.date: book.occupancy})
+
+    # Cache the day from the occupancy already in hand, still under the day lock so
+    # concurrent bookings write it in commit order; no recount on the write path
+    await write_through_slots(restaurant.id, payload.date, book.occupancy.slot_booked(), schedule.tables)
     await db.commit()
-    await db.refresh(booking)
-
-    # Invalidate/update cache by recomputing slots for that date
-    # Simpler: recompute and set cache now
-    stmt_counts: Select = (
-        select(Booking.time_slot, func.count(Booking.id))
-        .where(Booking.restaurant_id == payload.restaurant_id)
-        .where(Booking.date == payload.date)
-        .group_by(Booking.time_slot)
-    )
-    res = await db.execute(stmt_counts)
-    counts = {row[0]: int(row[1]) for row in res.all()}
-    slots = []
-    for t in settings.TIME_SLOTS:
-        booked = counts.get(t, 0)
-        free = max(restaurant.default_table_count - booked, 0)
-        slots.append({"time": t, "booked": booked, "free": free})
+    await pin_to_primary(restaurant.id)
+
+    return {"status": "ok", "booking_id": booking.id, "table_ids": list(table_ids)}
 
-    await set_cached_slots(payload.restaurant_id, str(payload.date), slots)
 
-    return {"status": "ok", "booking_id": booking.id}
+@router.post("/{restaurant_id}/import", response_model=ImportReport)
+async def import_bookings_file(
+    restaurant_id: int,
+    request: Request,
+    format: str | None = Query(default=None, pattern="^(csv|ndjson)$"),
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
 
+    fmt = format
+    if fmt is None:
+        content_type = request.headers.get("content-type", "")
+        fmt = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+
+    report, changed_days = await import_bookings(db, restaurant, request.stream(), fmt)
+    await db.commit()
+    await pin_to_primary(restaurant_id)
+
+    # Refresh every affected day in one query and one pipeline
+    if changed_days:
+        try:
+            counts = await count_bookings(db, restaurant, changed_days)
+            await set_cached_slots_many(
+                restaurant_id,
+                {d.isoformat(): c for d, c in counts.items()},
+                restaurant.default_table_count,
+                broadcast=True,
+            )
+        except RedisError as e:
+            logger.warning("slot cache refresh after import failed for %s: %s", restaurant_id, e)
+    return report
@@ -0,0 +1,17 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, status
+
+from ..config import settings
+from ..metrics import render_prometheus
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    if settings.METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return Response(content=render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,38 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+import json
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from redis.exceptions import RedisError
+from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..answer_cache import drop_settings_version, publish_settings_version
 from ..auth import get_current_user
-from ..db import get_db
-from ..models import Restaurant, RestaurantSettings
-from ..schemas import RestaurantSettingsIn, RestaurantSettingsOut
+from ..availability import Schedule
+from ..cache import (
+    drop_cached_settings,
+    drop_restaurant_slots,
+    get_cached_settings,
+    pin_to_primary,
+    set_cached_settings,
+    settings_etag,
+)
+from ..db import get_db, get_read_db
+from ..models import Restaurant, RestaurantSettings, RestaurantTable
+from ..schemas import (
+    RestaurantScheduleIn,
+    RestaurantScheduleOut,
+    RestaurantSettingsIn,
+    RestaurantSettingsOut,
+    TableIn,
+    TableOut,
+)
+from ..utils import etag_matches
+
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _settings_response(etag: str, body: str, if_none_match: Optional[str]) -> Response:
+    headers = {"ETag": f'"{etag}"'}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/{restaurant_id}/settings", response_model=RestaurantSettingsOut)
-async def get_settings(restaurant_id: int, _: dict = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    restaurant = await db.get(Restaurant, restaurant_id)
-    if restaurant is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+async def get_settings(
+    restaurant_id: int,
+    if_none_match: Optional[str] = Header(None),
+    _: dict = Depends(get_current_user),
+    # primary: a miss fills the Redis copy, which a lagging replica could make stale
+    db: AsyncSession = Depends(get_db),
+):
+    # Written through on every update, so a hit is served without Postgres
+    cached = await get_cached_settings(restaurant_id)
+    if cached is not None:
+        return _settings_response(*cached, if_none_match)
 
     settings = await db.get(RestaurantSettings, restaurant_id)
     if settings is None:
+        restaurant = await db.get(Restaurant, restaurant_id)
+        if restaurant is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
         # return empty defaults
-        return RestaurantSettingsOut(restaurant_id=restaurant_id, host_choice=None, greeting_text=None, info_text=None)
-    return RestaurantSettingsOut(
-        restaurant_id=restaurant_id,
-        host_choice=settings.host_choice,
-        greeting_text=settings.greeting_text,
-        info_text=settings.info_text,
-    )
+        out = RestaurantSettingsOut(restaurant_id=restaurant_id, host_choice=None, greeting_text=None, info_text=None)
+    else:
+        out = RestaurantSettingsOut(
+            restaurant_id=restaurant_id,
+            host_choice=settings.host_choice,
+            greeting_text=settings.greeting_text,
+            info_text=settings.info_text,
+        )
+    try:
+        etag, body = await set_cached_settings(restaurant_id, out.model_dump(), only_if_missing=True)
+    except RedisError as e:
+        logger.warning("settings cache fill failed for %s: %s", restaurant_id, e)
+        etag, body = settings_etag(out.model_dump()), json.dumps(out.model_dump())
+    return _settings_response(etag, body, if_none_match)
 
 
 @router.put("/{restaurant_id}/settings", response_model=RestaurantSettingsOut)
 async def update_settings(
     restaurant_id: int,
     payload: RestaurantSettingsIn,
+    response: Response,
     _: dict = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
@@ -49,11 +99,119 @@ async def update_settings(
     settings.greeting_text = payload.greeting_text
     settings.info_text = payload.info_text
 
+    # drop the cached copies before committing, so a Redis failure after it cannot keep the old settings live
+    try:
+        await drop_cached_settings(restaurant_id)
+        await drop_settings_version(restaurant_id)
+    except RedisError as e:
+        logger.warning("settings cache drop failed for %s: %s", restaurant_id, e)
     await db.commit()
-    return RestaurantSettingsOut(
+    await pin_to_primary(restaurant_id)
+    out = RestaurantSettingsOut(
         restaurant_id=restaurant_id,
         host_choice=settings.host_choice,
         greeting_text=settings.greeting_text,
         info_text=settings.info_text,
     )
+    try:
+        await publish_settings_version(restaurant_id, settings.greeting_text, settings.info_text)
+        await set_cached_settings(restaurant_id, out.model_dump())
+    except RedisError as e:
+        # the write stands; readers fill the cache from the database
+        logger.warning("settings cache update failed for %s: %s", restaurant_id, e)
+    response.headers["ETag"] = f'"{settings_etag(out.model_dump())}"'
+    return out
 
+
+def _schedule_out(restaurant: Restaurant) -> RestaurantScheduleOut:
+    return RestaurantScheduleOut(
+        restaurant_id=restaurant.id,
+        open_time=restaurant.open_time,
+        close_time=restaurant.close_time,
+        slot_minutes=restaurant.slot_minutes,
+        booking_minutes=restaurant.booking_minutes,
+        table_count=restaurant.default_table_count,
+        slots=Schedule.of(restaurant).slot_times(),
+    )
+
+
+@router.get("/{restaurant_id}/schedule", response_model=RestaurantScheduleOut)
+async def get_schedule(restaurant_id: int, _: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+    return _schedule_out(restaurant)
+
+
+@router.put("/{restaurant_id}/schedule", response_model=RestaurantScheduleOut)
+async def update_schedule(
+    restaurant_id: int,
+    payload: RestaurantScheduleIn,
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+
+    restaurant.open_time = payload.open_time
+    restaurant.close_time = payload.close_time
+    restaurant.slot_minutes = payload.slot_minutes
+    restaurant.booking_minutes = payload.booking_minutes
+    restaurant.default_table_count = payload.table_count
+    if not Schedule.of(restaurant).slot_starts():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Opening hours are shorter than one slot")
+
+    await db.commit()
+    await pin_to_primary(restaurant_id)
+    # every cached day was computed on the old grid
+    await drop_restaurant_slots(restaurant_id)
+    return _schedule_out(restaurant)
+
+
+async def _tables_out(db: AsyncSession, restaurant_id: int) -> List[TableOut]:
+    result = await db.execute(
+        select(RestaurantTable).where(RestaurantTable.restaurant_id == restaurant_id).order_by(RestaurantTable.id)
+    )
+    return [
+        TableOut(id=t.id, name=t.name, seats=t.seats, combine_group=t.combine_group)
+        for t in result.scalars().all()
+    ]
+
+
+@router.get("/{restaurant_id}/tables", response_model=List[TableOut])
+async def get_tables(restaurant_id: int, _: dict = Depends(get_current_user), db: AsyncSession = Depends(get_read_db)):
+    if await db.get(Restaurant, restaurant_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+    return await _tables_out(db, restaurant_id)
+
+
+@router.put("/{restaurant_id}/tables", response_model=List[TableOut])
+async def replace_tables(
+    restaurant_id: int,
+    payload: List[TableIn],
+    _: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """Replace the table inventory; existing seat assignments are dropped, re-seat with seating/optimize."""
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Restaurant not found")
+    if not payload:
+        # the table count is the restaurant's capacity; zero would refuse every booking
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="At least one table is required")
+    names = [t.name for t in payload]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Table names must be unique")
+
+    # booking_tables rows go with their tables (ON DELETE CASCADE)
+    await db.execute(delete(RestaurantTable).where(RestaurantTable.restaurant_id == restaurant_id))
+    db.add_all(
+        RestaurantTable(restaurant_id=restaurant_id, name=t.name, seats=t.seats, combine_group=t.combine_group)
+        for t in payload
+    )
+    restaurant.default_table_count = len(payload)
+    await db.commit()
+    await pin_to_primary(restaurant_id)
+    await drop_restaurant_slots(restaurant_id)
+    return await _tables_out(db, restaurant_id)
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional, Set, Tuple
+
+from fastapi import HTTPException, status
+
+from .config import settings
+from .metrics import counter, gauge
+from .upstream import upstream_request
+
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
+assistant_active_runs = gauge("assistant_active_runs", "Assistant runs currently admitted")
+assistant_queue_depth = gauge("assistant_queue_depth", "Assistant requests waiting for admission")
+assistant_admissions = counter("assistant_admissions_total", "Admission decisions by outcome")
+assistant_wait_seconds = counter("assistant_admission_wait_seconds_total", "Total time admitted requests spent queued")
+assistant_run_polls = counter("assistant_run_polls_total", "Upstream run status checks issued by the shared poller")
+
+
+class Overloaded(HTTPException):
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Assistant is busy, retry later",
+            headers={"Retry-After": str(settings.ASSISTANT_RETRY_AFTER_SECONDS)},
+        )
+
+
+class AdmissionController:
+    """Caps concurrent upstream runs globally and per restaurant, with a bounded FIFO wait queue."""
+
+    def __init__(self, max_active: int, max_per_restaurant: int, max_queue: int, queue_timeout_s: float) -> None:
+        self.max_active = max_active
+        self.max_per_restaurant = max_per_restaurant
+        self.max_queue = max_queue
+        self.queue_timeout_s = queue_timeout_s
+        self._active = 0
+        self._active_by_restaurant: Dict[int, int] = {}
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+
+    def _can_run(self, restaurant_id: int) -> bool:
+        return (
+            self._active < self.max_active
+            and self._active_by_restaurant.get(restaurant_id, 0) < self.max_per_restaurant
+        )
+
+    def _take(self, restaurant_id: int) -> None:
+        self._active += 1
+        self._active_by_restaurant[restaurant_id] = self._active_by_restaurant.get(restaurant_id, 0) + 1
+        assistant_active_runs.set(self._active)
+
+    def _wake(self) -> None:
+        # every waiter whose restaurant has room, in FIFO order; a busy restaurant does not block the others
+        for entry in list(self._waiters):
+            if self._active >= self.max_active:
+                return
+            restaurant_id, fut = entry
+            if not fut.done() and self._can_run(restaurant_id):
+                self._waiters.remove(entry)
+                self._take(restaurant_id)
+                fut.set_result(None)
+
+    def _queued_for(self, restaurant_id: int) -> bool:
+        return any(rid == restaurant_id and not fut.done() for rid, fut in self._waiters)
+
+    async def acquire(self, restaurant_id: int) -> None:
+        # waiters that could run were admitted by _wake already, so only an earlier
+        # waiter of the same restaurant has priority over this request
+        if self._can_run(restaurant_id) and not self._queued_for(restaurant_id):
+            self._take(restaurant_id)
+            assistant_admissions.inc(result="immediate")
+            return
+        if len(self._waiters) >= self.max_queue:
+            assistant_admissions.inc(result="rejected")
+            raise Overloaded()
+
+        fut: asyncio.Future = asyncio.get_running_loop().create_future()
+        entry = (restaurant_id, fut)
+        self._waiters.append(entry)
+        assistant_queue_depth.set(len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            if not fut.done():
+                assistant_admissions.inc(result="timeout")
+                raise Overloaded()
+            # admitted just as the timeout fired; keep the slot
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            elif fut.done():
+                self.release(restaurant_id)
+            raise
+        finally:
+            assistant_queue_depth.set(len(self._waiters))
+        assistant_wait_seconds.inc(time.monotonic() - started)
+        assistant_admissions.inc(result="queued")
+
+    def release(self, restaurant_id: int) -> None:
+        self._active -= 1
+        remaining = self._active_by_restaurant.get(restaurant_id, 1) - 1
+        if remaining > 0:
+            self._active_by_restaurant[restaurant_id] = remaining
+        else:
+            self._active_by_restaurant.pop(restaurant_id, None)
+        assistant_active_runs.set(self._active)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, restaurant_id: int) -> AsyncIterator[None]:
+        await self.acquire(restaurant_id)
+        try:
+            yield
+        finally:
+            self.release(restaurant_id)
+
+
+@dataclass
+class _TrackedRun:
+    headers: Dict[str, str]
+    deadline: float
+    future: asyncio.Future
+    interval: float = field(default_factory=lambda: settings.ASSISTANT_POLL_MIN_INTERVAL_SECONDS)
+    next_check: float = 0.0
+    checking: bool = False
+
+
+class RunTracker:
+    """One background loop checks every in-flight run instead of a sleep loop per request.
+
+    Each run is re-checked on its own schedule that backs off from the minimum
+    to the maximum poll interval while it stays in progress. Each check runs as
+    its own task, bounded by ASSISTANT_POLL_CONCURRENCY, so a slow status call
+    does not hold up other runs or deadline enforcement.
+    """
+
+    def __init__(self) -> None:
+        self._runs: Dict[Tuple[str, str], _TrackedRun] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._checks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+
+    async def wait(self, headers: Dict[str, str], thread_id: str, run_id: str, timeout_s: float) -> str:
+        now = time.monotonic()
+        run = _TrackedRun(
+            headers=headers,
+            deadline=now + timeout_s,
+            future=asyncio.get_running_loop().create_future(),
+            next_check=now + settings.ASSISTANT_POLL_MIN_INTERVAL_SECONDS,
+        )
+        self._runs[(thread_id, run_id)] = run
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+        self._wakeup.set()
+        try:
+            return await run.future
+        finally:
+            self._runs.pop((thread_id, run_id), None)
+
+    async def _check(self, key: Tuple[str, str], run: _TrackedRun, limiter: asyncio.Semaphore) -> None:
+        thread_id, run_id = key
+        try:
+            async with limiter:
+                try:
+                    resp = await upstream_request("GET", f"/threads/{thread_id}/runs/{run_id}", headers=run.headers)
+                    st = resp.json().get("status")
+                except Exception as e:
+                    if not run.future.done():
+                        run.future.set_exception(e)
+                    return
+            assistant_run_polls.inc()
+            if run.future.done():
+                return
+            if st in TERMINAL_STATUSES:
+                run.future.set_result(st)
+                return
+            run.interval = min(run.interval * 1.5, settings.ASSISTANT_POLL_MAX_INTERVAL_SECONDS)
+            run.next_check = time.monotonic() + run.interval
+        finally:
+            run.checking = False
+            # the loop may be sleeping without a next_check for this run
+            self._wakeup.set()
+
+    async def _loop(self) -> None:
+        limiter = asyncio.Semaphore(settings.ASSISTANT_POLL_CONCURRENCY)
+        while self._runs:
+            now = time.monotonic()
+            for key, run in list(self._runs.items()):
+                if run.future.done():
+                    continue
+                if run.deadline <= now:
+                    run.future.set_exception(HTTPException(status_code=504, detail="Assistant run timeout"))
+                elif run.next_check <= now and not run.checking:
+                    run.checking = True
+                    task = asyncio.create_task(self._check(key, run, limiter))
+                    self._checks.add(task)
+                    task.add_done_callback(self._checks.discard)
+            pending = [r for r in self._runs.values() if not r.future.done()]
+            if not pending:
+                await asyncio.sleep(0)
+                continue
+            # runs being checked only need their deadline watched
+            sleep_for = max(
+                min(r.deadline if r.checking else min(r.next_check, r.deadline) for r in pending) - time.monotonic(),
+                0.0,
+            )
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        for task in [self._task, *self._checks]:
+            if task is None:
+                continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._checks.clear()
+
+
+admission = AdmissionController(
+    max_active=settings.ASSISTANT_MAX_ACTIVE_RUNS,
+    max_per_restaurant=settings.ASSISTANT_MAX_RUNS_PER_RESTAURANT,
+    max_queue=settings.ASSISTANT_MAX_QUEUE,
+    queue_timeout_s=settings.ASSISTANT_QUEUE_TIMEOUT_SECONDS,
+)
+run_tracker = RunTracker()
@@ -1,5 +1,5 @@
 from datetime import date
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -17,18 +17,51 @@ class LoginRequest(BaseModel):
 class BookingCreate(BaseModel):
     restaurant_id: int = Field(..., ge=1)
     date: date
-    time_slot: str  # retained for capacity counting
-    client_name: str
+    # lengths match the bookings columns, so a valid payload always fits the INSERT/COPY
+    time_slot: str = Field(..., max_length=10)  # retained for capacity counting
+    client_name: str = Field(..., max_length=255)
     # New fields
+    start_time: str | None = Field(default=None, max_length=10)
+    end_time: str | None = Field(default=None, max_length=10)
+    phone: str | None = Field(default=None, max_length=32)
+    guest_count: int | None = Field(default=None, ge=1)
+    comment: str | None = None
+    tags: list[str] | None = None
+    deposit: bool = False
+
+
+class BookingOut(BaseModel):
+    id: int
+    restaurant_id: int
+    date: date
+    time_slot: str
+    client_name: str
     start_time: str | None = None
     end_time: str | None = None
     phone: str | None = None
-    guest_count: int | None = Field(default=None, ge=1)
+    guest_count: int | None = None
     comment: str | None = None
-    tags: list[str] | None = None
+    tags: list[str] = []
     deposit: bool = False
 
 
+class BookingPage(BaseModel):
+    items: List[BookingOut]
+    next_cursor: str | None = None
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportReport(BaseModel):
+    total: int = 0
+    inserted: int = 0
+    rejected: int = 0
+    errors: List[ImportRowError] = []
+
+
 class SlotInfo(BaseModel):
     time: str
     booked: int
@@ -41,6 +74,77 @@ class SlotsResponse(BaseModel):
     slots: List[SlotInfo]
 
 
+class DaySlots(BaseModel):
+    date: date
+    slots: List[SlotInfo]
+
+
+class SlotsRangeResponse(BaseModel):
+    restaurant_id: int
+    days: List[DaySlots]
+
+
+class DayTagCounts(BaseModel):
+    date: date
+    counts: Dict[str, int]
+
+
+class TagCountsResponse(BaseModel):
+    restaurant_id: int
+    days: List[DayTagCounts]
+
+
+class OccupancyRow(BaseModel):
+    # set according to group_by; weekday is ISO (1 = Monday)
+    day: date | None = None
+    weekday: int | None = None
+    time_slot: str | None = None
+    days: int  # calendar days of the range in this group
+    bookings: int
+    guests: int
+    deposits: int
+    table_minutes: int  # held during the group's slots, by bookings of any start
+    avg_bookings: float  # per day
+    avg_guests: float
+    occupancy: float | None  # share of the table-minutes the group's slots offer, averaged per day
+
+
+class OccupancyReport(BaseModel):
+    restaurant_id: int
+    date_from: date
+    date_to: date
+    group_by: str
+    tables: int
+    rows: List[OccupancyRow]
+
+
+class SeatAssignment(BaseModel):
+    booking_id: int
+    table_ids: List[int]
+
+
+class SeatingPlanOut(BaseModel):
+    restaurant_id: int
+    date: date
+    assignments: List[SeatAssignment]
+    unseated: List[int]
+    # seats at assigned tables beyond party sizes, lower is tighter
+    spare_seats: int
+    applied: bool = False
+    moved: int = 0
+
+
+class TableIn(BaseModel):
+    name: str = Field(..., min_length=1, max_length=64)
+    seats: int = Field(..., ge=1)
+    # tables with the same group can be pushed together for one party
+    combine_group: str | None = Field(default=None, max_length=64)
+
+
+class TableOut(TableIn):
+    id: int
+
+
 class RestaurantSettingsIn(BaseModel):
     host_choice: str | None = None
     greeting_text: str | None = None
@@ -51,10 +155,30 @@ class RestaurantSettingsOut(RestaurantSettingsIn):
     restaurant_id: int
 
 
+HHMM_PATTERN = r"^([01]\d|2[0-3]):[0-5]\d$"
+
+
+class RestaurantScheduleIn(BaseModel):
+    open_time: str = Field(..., pattern=HHMM_PATTERN)
+    # at or before open_time means closing after midnight
+    close_time: str = Field(..., pattern=HHMM_PATTERN)
+    slot_minutes: int = Field(..., ge=5, le=720)
+    # how long a booking without an end time holds a table
+    booking_minutes: int = Field(..., ge=5, le=1440)
+    table_count: int = Field(..., ge=0)
+
+
+class RestaurantScheduleOut(RestaurantScheduleIn):
+    restaurant_id: int
+    slots: List[str]
+
+
 class AssistantChatRequest(BaseModel):
     assistant_id: str
     message: str
     thread_id: str | None = None
+    # serve/store repeated questions from the answer cache (new threads only)
+    use_cache: bool = False
 
 
 class AssistantChatResponse(BaseModel):
@@ -0,0 +1,261 @@
+from dataclasses import dataclass
+from datetime import date
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .availability import DayOccupancy, Schedule, load_occupancy
+from .models import Booking, BookingTable, RestaurantTable
+
+
+# Most tables pushed together for one party, and how many free tables of a
+# group are considered when searching combinations (bounds the search)
+MAX_COMBINED_TABLES = 3
+MAX_COMBINE_CANDIDATES = 10
+
+
+@dataclass(frozen=True)
+class Table:
+    id: int
+    seats: int
+    group: Optional[str] = None
+
+
+@dataclass
+class Party:
+    booking_id: Optional[int]
+    guests: int
+    start: int
+    end: int
+
+
+Placement = Tuple[Tuple[int, ...], List[Tuple[int, Tuple[int, ...]]]]
+
+
+class SeatingPlan:
+    """Which tables each booking of one service day sits at.
+
+    Placement is best fit: the smallest free table that seats the party, else
+    the combination within one combine group with the fewest spare seats.
+    When neither exists, a bounded local search tries to free a suitable
+    table by moving one blocking booking to another free table.
+    """
+
+    def __init__(self, tables: Sequence[Table]) -> None:
+        self.tables: Dict[int, Table] = {t.id: t for t in tables}
+        # by seats, so the first fitting table is the best fit
+        self._by_size = sorted(tables, key=lambda t: (t.seats, t.id))
+        self.parties: Dict[int, Party] = {}
+        self.assigned: Dict[int, Tuple[int, ...]] = {}
+        self._busy: Dict[int, List[Tuple[int, int, int]]] = {t.id: [] for t in tables}
+
+    def _blockers(self, table_id: int, start: int, end: int) -> List[int]:
+        return [bid for s, e, bid in self._busy[table_id] if s < end and start < e]
+
+    def is_free(self, table_id: int, start: int, end: int) -> bool:
+        return not any(s < end and start < e for s, e, _ in self._busy[table_id])
+
+    def assign(self, party: Party, table_ids: Tuple[int, ...]) -> None:
+        assert party.booking_id is not None
+        self.unassign(party.booking_id)
+        self.parties[party.booking_id] = party
+        self.assigned[party.booking_id] = table_ids
+        for table_id in table_ids:
+            self._busy[table_id].append((party.start, party.end, party.booking_id))
+
+    def unassign(self, booking_id: int) -> None:
+        for table_id in self.assigned.pop(booking_id, ()):
+            self._busy[table_id] = [b for b in self._busy[table_id] if b[2] != booking_id]
+
+    def _best_single(self, party: Party, exclude: int = -1) -> Optional[int]:
+        for table in self._by_size:
+            if table.seats >= party.guests and table.id != exclude and self.is_free(table.id, party.start, party.end):
+                return table.id
+        return None
+
+    def _best_combination(self, party: Party) -> Optional[Tuple[int, ...]]:
+        groups: Dict[str, List[Table]] = {}
+        for table in self._by_size:
+            if table.group is not None and self.is_free(table.id, party.start, party.end):
+                groups.setdefault(table.group, []).append(table)
+        best: Optional[Tuple[int, int, Tuple[int, ...]]] = None
+        for free in groups.values():
+            # the largest tables reach the party size with the fewest joins
+            free = free[-MAX_COMBINE_CANDIDATES:]
+            for k in range(2, min(MAX_COMBINED_TABLES, len(free)) + 1):
+                for combo in combinations(free, k):
+                    seats = sum(t.seats for t in combo)
+                    if seats >= party.guests and (best is None or (seats, k) < best[:2]):
+                        best = (seats, k, tuple(t.id for t in combo))
+        return best[2] if best else None
+
+    def _free_by_moving_one(self, party: Party) -> Optional[Placement]:
+        for table in self._by_size:
+            if table.seats < party.guests:
+                continue
+            blockers = self._blockers(table.id, party.start, party.end)
+            if len(blockers) != 1 or len(self.assigned[blockers[0]]) != 1:
+                continue
+            blocker = self.parties[blockers[0]]
+            target = self._best_single(blocker, exclude=table.id)
+            if target is not None:
+                return (table.id,), [(blocker.booking_id, (target,))]
+        return None
+
+    def place(self, party: Party) -> Optional[Placement]:
+        """(tables for the party, moves of existing bookings) or None if it cannot be seated; nothing is applied."""
+        single = self._best_single(party)
+        if single is not None:
+            return (single,), []
+        combo = self._best_combination(party)
+        if combo is not None:
+            return combo, []
+        return self._free_by_moving_one(party)
+
+    def apply(self, party: Party, placement: Placement) -> None:
+        table_ids, moves = placement
+        for booking_id, new_tables in moves:
+            self.assign(self.parties[booking_id], new_tables)
+        self.assign(party, table_ids)
+
+    def intervals(self) -> List[Tuple[int, int, int]]:
+        """(start, end, tables used) per booking, for DayOccupancy."""
+        return [(p.start, p.end, max(len(self.assigned.get(bid, ())), 1)) for bid, p in self.parties.items()]
+
+    def spare_seats(self) -> int:
+        return sum(sum(self.tables[t].seats for t in ids) - self.parties[bid].guests for bid, ids in self.assigned.items())
+
+
+def optimise(tables: Sequence[Table], parties: Iterable[Party]) -> Tuple[SeatingPlan, List[int]]:
+    """Seat a whole day from scratch; returns the plan and the bookings left unseated.
+
+    Parties are placed in start order, larger parties first among those
+    starting together, which keeps big tables free for the parties that need them.
+    """
+    plan = SeatingPlan(tables)
+    unseated: List[int] = []
+    for party in sorted(parties, key=lambda p: (p.start, -p.guests, p.booking_id)):
+        placement = plan.place(party)
+        if placement is None:
+            unseated.append(party.booking_id)
+            plan.parties[party.booking_id] = party
+        else:
+            plan.apply(party, placement)
+    return plan, unseated
+
+
+class NoCapacity(Exception):
+    """The booking does not fit the day; the message is the reason shown to the client."""
+
+
+class DayBook:
+    """Capacity of one locked service day: table occupancy, plus the seating plan when the restaurant has tables.
+
+    New bookings are reserved under a caller-chosen temporary (negative) id,
+    since their real id is known only after the INSERT.
+    """
+
+    def __init__(self, occupancy: DayOccupancy, plan: Optional[SeatingPlan] = None) -> None:
+        self.occupancy = occupancy
+        self.plan = plan
+
+    def reserve(self, temp_id: int, guests: int, start: int, end: int) -> Placement:
+        """Hold tables for a new booking and return its placement; raises NoCapacity."""
+        party = Party(temp_id, guests, start, end)
+        placement: Placement = ((), [])
+        used = 1
+        if self.plan is not None:
+            found = self.plan.place(party)
+            if found is None:
+                raise NoCapacity("No free table for this party size")
+            placement, used = found, len(found[0])
+        if not self.occupancy.fits(start, end, used):
+            raise NoCapacity("No free tables for selected slot")
+        if self.plan is not None:
+            self.plan.apply(party, placement)
+        self.occupancy.add(start, end, used)
+        return placement
+
+
+async def load_day_books(
+    db: AsyncSession,
+    restaurant_id: int,
+    schedule: Schedule,
+    days: Sequence[date],
+) -> Dict[date, DayBook]:
+    """DayBook per day; one query for all days without a floor plan, one per day with it."""
+    tables = await load_tables(db, restaurant_id)
+    if not tables:
+        occupancy = await load_occupancy(db, restaurant_id, schedule, days)
+        return {day: DayBook(occupancy[day]) for day in days}
+    books: Dict[date, DayBook] = {}
+    for day in days:
+        plan = await load_seating(db, restaurant_id, schedule, day, tables)
+        books[day] = DayBook(DayOccupancy(schedule, plan.intervals()), plan)
+    return books
+
+
+async def load_tables(db: AsyncSession, restaurant_id: int) -> List[Table]:
+    result = await db.execute(
+        select(RestaurantTable.id, RestaurantTable.seats, RestaurantTable.combine_group)
+        .where(RestaurantTable.restaurant_id == restaurant_id)
+        .order_by(RestaurantTable.id)
+    )
+    return [Table(*row) for row in result.all()]
+
+
+async def load_seating(
+    db: AsyncSession,
+    restaurant_id: int,
+    schedule: Schedule,
+    day: date,
+    tables: Sequence[Table],
+) -> SeatingPlan:
+    """Current plan of a day: every booking with its interval, party size and tables, in one query."""
+    stmt: Select = (
+        select(
+            Booking.id,
+            Booking.time_slot,
+            Booking.start_time,
+            Booking.end_time,
+            Booking.guest_count,
+            BookingTable.table_id,
+        )
+        .outerjoin(BookingTable, BookingTable.booking_id == Booking.id)
+        .where(Booking.restaurant_id == restaurant_id)
+        .where(Booking.date == day)
+    )
+    parties: Dict[int, Party] = {}
+    seated: Dict[int, List[int]] = {}
+    for booking_id, time_slot, start_time, end_time, guests, table_id in (await db.execute(stmt)).all():
+        if booking_id not in parties:
+            try:
+                start, end = schedule.interval(time_slot, start_time, end_time)
+            except ValueError:
+                try:
+                    start, end = schedule.interval(time_slot, None, None)
+                except ValueError:
+                    continue
+            parties[booking_id] = Party(booking_id, guests or 1, start, end)
+        if table_id is not None and booking_id in parties:
+            seated.setdefault(booking_id, []).append(table_id)
+    plan = SeatingPlan(tables)
+    for booking_id, party in parties.items():
+        table_ids = tuple(t for t in seated.get(booking_id, ()) if t in plan.tables)
+        if table_ids:
+            plan.assign(party, table_ids)
+        else:
+            plan.parties[booking_id] = party
+    return plan
+
+
+async def save_assignments(db: AsyncSession, assignments: Dict[int, Tuple[int, ...]]) -> None:
+    """Replace the tables of the given bookings; the caller holds the day lock and commits."""
+    if not assignments:
+        return
+    await db.execute(delete(BookingTable).where(BookingTable.booking_id.in_(list(assignments))))
+    rows = [{"booking_id": bid, "table_id": t} for bid, table_ids in assignments.items() for t in table_ids]
+    if rows:
+        await db.execute(insert(BookingTable), rows)
@@ -0,0 +1,40 @@
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .availability import Schedule, load_occupancy
+from .models import Restaurant
+
+
+def build_slots(booked: Dict[str, int], table_count: int) -> List[dict]:
+    """Slot list in schedule order from per-slot booked tables."""
+    return [{"time": t, "booked": n, "free": max(table_count - n, 0)} for t, n in booked.items()]
+
+
+async def lock_days(db: AsyncSession, restaurant_id: int, days: Iterable[date]) -> None:
+    """Serialise capacity checks per restaurant day until the transaction ends.
+
+    Days are locked in order so two writers touching overlapping days cannot
+    deadlock. Readers are not blocked.
+    """
+    for day in sorted(set(days)):
+        await db.execute(select(func.pg_advisory_xact_lock(restaurant_id, day.toordinal())))
+
+
+async def count_bookings(db: AsyncSession, restaurant: Any, days: Iterable[date]) -> Dict[date, Dict[str, int]]:
+    """Booked tables per slot for several days of one restaurant, one query and one pass per day.
+
+    restaurant is a Restaurant or a row selected with SCHEDULE_COLUMNS.
+    """
+    occupancy = await load_occupancy(db, restaurant.id, Schedule.of(restaurant), days)
+    return {d: o.slot_booked() for d, o in occupancy.items()}
+
+
+async def load_day_counts(db: AsyncSession, restaurant_id: int, day: date) -> Optional[Tuple[Dict[str, int], int]]:
+    """(booked per slot, table_count) for one day, or None if the restaurant does not exist."""
+    restaurant = await db.get(Restaurant, restaurant_id)
+    if restaurant is None:
+        return None
+    return (await count_bookings(db, restaurant, [day]))[day], restaurant.default_table_count
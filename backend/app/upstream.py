@@ -0,0 +1,151 @@
+import asyncio
+import random
+from typing import Any, AsyncIterator, Optional, Tuple
+
+import httpx
+
+from .config import settings
+from .instrumentation import UPSTREAM_EVENT_HOOKS
+
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# the request never reached the upstream, so even a POST can be sent again
+UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_upstream_client() -> httpx.AsyncClient:
+    """App-lifetime client for the assistants API; one keep-alive pool per worker."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=settings.OPENAI_BASE_URL,
+            http2=settings.OPENAI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=httpx.Timeout(settings.OPENAI_TIMEOUT_SECONDS, connect=settings.OPENAI_CONNECT_TIMEOUT_SECONDS),
+            event_hooks=UPSTREAM_EVENT_HOOKS,
+        )
+    return _client
+
+
+async def close_upstream() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _retry_delay(attempt: int, resp: Optional[httpx.Response]) -> float:
+    if resp is not None:
+        retry_after = resp.headers.get("retry-after")
+        if retry_after:
+            try:
+                return min(float(retry_after), settings.OPENAI_RETRY_MAX_DELAY_SECONDS)
+            except ValueError:
+                pass
+    # full jitter exponential backoff
+    cap = min(settings.OPENAI_RETRY_BACKOFF_SECONDS * (2 ** attempt), settings.OPENAI_RETRY_MAX_DELAY_SECONDS)
+    return random.uniform(0, cap)
+
+
+def _retryable_status(method: str, status_code: int) -> bool:
+    # a POST answered with 5xx may have posted the message or started the run already
+    if method.upper() in IDEMPOTENT_METHODS:
+        return status_code in RETRY_STATUSES
+    return status_code == 429
+
+
+def _retryable_error(method: str, exc: httpx.TransportError) -> bool:
+    return method.upper() in IDEMPOTENT_METHODS or isinstance(exc, UNSENT_ERRORS)
+
+
+async def upstream_request(
+    method: str,
+    path: str,
+    *,
+    headers: dict[str, str],
+    timeout: float | None = None,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Send a request to the assistants API, retrying with jittered backoff.
+
+    GETs are retried on 429/5xx and transport errors; other methods are not
+    idempotent and only retried on 429 and when the connection was never made.
+
+    Raises httpx.HTTPStatusError for a final non-2xx response.
+    """
+    client = get_upstream_client()
+    request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+    attempt = 0
+    while True:
+        resp: Optional[httpx.Response] = None
+        try:
+            resp = await client.request(method, path, headers=headers, timeout=request_timeout, **kwargs)
+            if not _retryable_status(method, resp.status_code) or attempt >= settings.OPENAI_MAX_RETRIES:
+                resp.raise_for_status()
+                return resp
+        except httpx.TransportError as e:
+            if not _retryable_error(method, e) or attempt >= settings.OPENAI_MAX_RETRIES:
+                raise
+        await asyncio.sleep(_retry_delay(attempt, resp))
+        attempt += 1
+
+
+async def upstream_events(
+    path: str,
+    *,
+    headers: dict[str, str],
+    json: Any,
+    timeout: float | None = None,
+) -> AsyncIterator[Tuple[str, str]]:
+    """POST to a streaming endpoint and yield (event, data) pairs as server-sent events arrive.
+
+    Opening the stream is retried like a POST in upstream_request; once events
+    have been yielded a failure is raised to the caller instead.
+    """
+    client = get_upstream_client()
+    request_timeout = httpx.USE_CLIENT_DEFAULT if timeout is None else timeout
+    attempt = 0
+    started = False
+    while True:
+        try:
+            async with client.stream(
+                "POST",
+                path,
+                headers={**headers, "Accept": "text/event-stream"},
+                json=json,
+                timeout=request_timeout,
+            ) as resp:
+                if _retryable_status("POST", resp.status_code) and attempt < settings.OPENAI_MAX_RETRIES:
+                    await resp.aread()
+                    delay = _retry_delay(attempt, resp)
+                else:
+                    if resp.is_error:
+                        await resp.aread()
+                        resp.raise_for_status()
+                    event, data = "message", []
+                    async for line in resp.aiter_lines():
+                        if not line:
+                            if data:
+                                started = True
+                                yield event, "\n".join(data)
+                            event, data = "message", []
+                        elif line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].lstrip())
+                    if data:
+                        yield event, "\n".join(data)
+                    return
+        except httpx.TransportError as e:
+            if started or not _retryable_error("POST", e) or attempt >= settings.OPENAI_MAX_RETRIES:
+                raise
+            delay = _retry_delay(attempt, None)
+        await asyncio.sleep(delay)
+        attempt += 1
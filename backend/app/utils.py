@@ -4,3 +4,17 @@ from datetime import date
 def date_to_str(d: date) -> str:
     return d.isoformat()
 
+
+def etag_matches(if_none_match: str | None, version: str | None) -> bool:
+    """True when an If-None-Match header covers the given version (weak comparison)."""
+    if not if_none_match or not version:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == version:
+            return True
+    return False
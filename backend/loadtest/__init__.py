@@ -0,0 +1 @@
+"""Load-test scenarios, runner and mock upstream; see `python -m loadtest --help`."""
@@ -0,0 +1,216 @@
+"""Load generator for the booking API.
+
+    python -m loadtest run --scenario all --booking-restaurant-id 99 --out result.json
+    python -m loadtest run --target http://localhost:8000 --scenario read_heavy
+    python -m loadtest compare baseline.json result.json
+    python -m loadtest mock --mock-port 8099
+
+Without --target the app runs in this process (no HTTP server in between)
+against the DB_URL/REDIS_URL of the environment, e.g. the Postgres and Redis
+of `docker compose up db redis`.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+import uvicorn
+
+from .compare import compare
+from .mock_openai import create_mock_app
+from .runner import Context, Recorder
+from .scenarios import SCENARIOS
+
+
+@asynccontextmanager
+async def _mock_upstream(args: argparse.Namespace) -> AsyncIterator[str]:
+    app = create_mock_app(args.mock_run_seconds, args.mock_tokens, args.mock_error_rate)
+    server = uvicorn.Server(uvicorn.Config(app, host=args.mock_host, port=args.mock_port, log_level="warning", lifespan="off"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    try:
+        yield f"http://{args.mock_host}:{args.mock_port}/v1"
+    finally:
+        server.should_exit = True
+        await task
+
+
+@asynccontextmanager
+async def _client(args: argparse.Namespace, mock_url: Optional[str]) -> AsyncIterator[httpx.AsyncClient]:
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    timeout = httpx.Timeout(args.timeout)
+    if args.target:
+        async with httpx.AsyncClient(base_url=args.target, limits=limits, timeout=timeout) as client:
+            yield client
+        return
+
+    from app.config import settings
+    from app.main import app
+
+    if mock_url:
+        # read when the lifespan creates the upstream client
+        settings.OPENAI_BASE_URL = mock_url
+        settings.OPENAI_API_KEY = settings.OPENAI_API_KEY or "sk-loadtest"
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as client:
+            yield client
+
+
+async def _run_scenario(client: httpx.AsyncClient, name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    recorder = Recorder()
+    scenario = SCENARIOS[name]
+    restaurant_id = args.booking_restaurant_id if scenario.writes else args.restaurant_id
+    ctx = Context(client, recorder, restaurant_id, args.seed)
+    ctx.state["run_id"] = uuid.uuid4().hex[:8]
+    resp = await client.post("/auth/login", json={"username": args.username, "password": args.password})
+    resp.raise_for_status()
+    ctx.headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    checks = await scenario.run(ctx, args.concurrency, args.duration, args.warmup)
+    return {"description": scenario.description, **recorder.summary(), "checks": checks}
+
+
+async def _run(args: argparse.Namespace) -> int:
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    writing = [n for n in names if SCENARIOS[n].writes]
+    if writing and args.booking_restaurant_id is None:
+        print(
+            f"{', '.join(writing)} create bookings that are not deleted; pass --booking-restaurant-id "
+            "of a restaurant kept for load tests",
+            file=sys.stderr,
+        )
+        return 2
+    needs_mock = any(SCENARIOS[n].needs_assistant for n in names) and not args.no_mock
+    if needs_mock and args.target:
+        print(
+            f"mock upstream on {args.mock_host}:{args.mock_port}; the target must run with "
+            "OPENAI_BASE_URL pointing there and a non-empty OPENAI_API_KEY",
+            file=sys.stderr,
+        )
+    result: Dict[str, Any] = {
+        "schema": 1,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.target or "in-process",
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "restaurant_id": args.restaurant_id,
+            "booking_restaurant_id": args.booking_restaurant_id,
+            "seed": args.seed,
+            "mock_run_seconds": args.mock_run_seconds if needs_mock else None,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "scenarios": {},
+    }
+
+    async def run_all(mock_url: Optional[str]) -> None:
+        async with _client(args, mock_url) as client:
+            for name in names:
+                print(f"running {name} ...", file=sys.stderr)
+                result["scenarios"][name] = await _run_scenario(client, name, args)
+
+    if needs_mock:
+        async with _mock_upstream(args) as mock_url:
+            await run_all(mock_url)
+    else:
+        await run_all(None)
+
+    _write(result, args.out)
+    # a failed correctness check (e.g. an overbooked slot) fails the run
+    return 0 if all(s["checks"].get("passed", True) for s in result["scenarios"].values()) else 1
+
+
+def _write(data: Dict[str, Any], path: Optional[str]) -> None:
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def _compare(args: argparse.Namespace) -> int:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    report = compare(
+        baseline,
+        current,
+        latency_tolerance=args.latency_tolerance,
+        throughput_tolerance=args.throughput_tolerance,
+        error_tolerance=args.error_tolerance,
+        min_delta_ms=args.min_delta_ms,
+    )
+    _write(report, args.out)
+    return 0 if report["passed"] else 1
+
+
+async def _serve_mock(args: argparse.Namespace) -> None:
+    async with _mock_upstream(args) as url:
+        print(f"mock assistants upstream at {url}", file=sys.stderr)
+        await asyncio.Event().wait()
+
+
+def _add_mock_args(parser: argparse.ArgumentParser, host: str) -> None:
+    parser.add_argument("--mock-host", default=host)
+    parser.add_argument("--mock-port", type=int, default=8099)
+    parser.add_argument("--mock-run-seconds", type=float, default=0.5, help="time until a mock run completes")
+    parser.add_argument("--mock-tokens", type=int, default=20, help="words in a mock answer")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="share of mock requests answered with 500")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m loadtest", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="run scenarios and write JSON results")
+    run.add_argument("--scenario", choices=[*SCENARIOS, "all"], default="all")
+    run.add_argument("--target", help="base URL of a running backend; in-process app when omitted")
+    run.add_argument("--concurrency", type=int, default=20)
+    run.add_argument("--duration", type=float, default=30.0, help="measured seconds per scenario")
+    run.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before each scenario")
+    run.add_argument("--timeout", type=float, default=30.0)
+    run.add_argument("--restaurant-id", type=int, default=1, help="restaurant the read-only scenarios use")
+    run.add_argument("--booking-restaurant-id", type=int, help="dedicated restaurant for scenarios that create bookings")
+    run.add_argument("--username", default=os.getenv("ADMIN_USERNAME", "admin"))
+    run.add_argument("--password", default=os.getenv("ADMIN_PASSWORD", "password123"))
+    run.add_argument("--seed", type=int, default=1)
+    run.add_argument("--no-mock", action="store_true", help="do not start the mock assistants upstream")
+    run.add_argument("--out", help="result file; stdout when omitted")
+    _add_mock_args(run, "127.0.0.1")
+
+    cmp = sub.add_parser("compare", help="compare a result against a baseline; exit 1 on regression")
+    cmp.add_argument("baseline")
+    cmp.add_argument("current")
+    cmp.add_argument("--latency-tolerance", type=float, default=0.2, help="allowed relative p95/p99 increase")
+    cmp.add_argument("--throughput-tolerance", type=float, default=0.2, help="allowed relative throughput drop")
+    cmp.add_argument("--error-tolerance", type=float, default=0.01, help="allowed absolute error-rate increase")
+    cmp.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore latency increases smaller than this")
+    cmp.add_argument("--out", help="report file; stdout when omitted")
+
+    mock = sub.add_parser("mock", help="serve the mock assistants upstream for a separately started backend")
+    _add_mock_args(mock, "0.0.0.0")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return asyncio.run(_run(args))
+    if args.command == "compare":
+        return _compare(args)
+    asyncio.run(_serve_mock(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
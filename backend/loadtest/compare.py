@@ -0,0 +1,65 @@
+from typing import Any, Dict, List
+
+
+GATED_PERCENTILES = ("p95", "p99")
+
+
+def _change(base: float, current: float) -> float:
+    return round((current - base) / base, 4) if base else 0.0
+
+
+def compare(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    latency_tolerance: float = 0.2,
+    throughput_tolerance: float = 0.2,
+    error_tolerance: float = 0.01,
+    min_delta_ms: float = 2.0,
+) -> Dict[str, Any]:
+    """Diff two result files per scenario and operation.
+
+    A regression is a p95/p99 latency more than latency_tolerance (relative) and
+    min_delta_ms (absolute, filters noise on sub-millisecond ops) above the
+    baseline, throughput more than throughput_tolerance below it, or an error
+    rate more than error_tolerance (absolute) above it. Scenarios or operations
+    present in only one file are listed but never fail the comparison.
+    """
+    regressions: List[Dict[str, Any]] = []
+    scenarios: Dict[str, Any] = {}
+    unmatched: List[str] = []
+    for name, cur in current.get("scenarios", {}).items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            unmatched.append(name)
+            continue
+        report: Dict[str, Any] = {
+            "throughput_rps": {
+                "baseline": base["throughput_rps"],
+                "current": cur["throughput_rps"],
+                "change": _change(base["throughput_rps"], cur["throughput_rps"]),
+            },
+            "operations": {},
+        }
+        if cur["throughput_rps"] < base["throughput_rps"] * (1 - throughput_tolerance):
+            regressions.append({"scenario": name, "metric": "throughput_rps", **report["throughput_rps"]})
+        for op, cur_op in cur["operations"].items():
+            base_op = base["operations"].get(op)
+            if base_op is None:
+                unmatched.append(f"{name}/{op}")
+                continue
+            op_report: Dict[str, Any] = {}
+            for q, current_ms in cur_op["latency_ms"].items():
+                base_ms = base_op["latency_ms"].get(q, 0.0)
+                op_report[q] = {"baseline": base_ms, "current": current_ms, "change": _change(base_ms, current_ms)}
+                if (
+                    q in GATED_PERCENTILES
+                    and current_ms > base_ms * (1 + latency_tolerance)
+                    and current_ms - base_ms >= min_delta_ms
+                ):
+                    regressions.append({"scenario": name, "operation": op, "metric": f"latency_ms.{q}", **op_report[q]})
+            op_report["error_rate"] = {"baseline": base_op["error_rate"], "current": cur_op["error_rate"]}
+            if cur_op["error_rate"] > base_op["error_rate"] + error_tolerance:
+                regressions.append({"scenario": name, "operation": op, "metric": "error_rate", **op_report["error_rate"]})
+            report["operations"][op] = op_report
+        scenarios[name] = report
+    return {"passed": not regressions, "regressions": regressions, "scenarios": scenarios, "unmatched": unmatched}
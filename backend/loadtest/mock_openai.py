@@ -0,0 +1,89 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Set
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_mock_app(run_seconds: float = 0.5, tokens: int = 20, error_rate: float = 0.0) -> FastAPI:
+    """Stand-in for the OpenAI Assistants v2 endpoints the proxy calls.
+
+    Runs complete run_seconds after creation (polled or streamed as `tokens`
+    deltas); error_rate of requests fail with 500 to exercise the proxy's retries.
+    """
+    app = FastAPI(title="mock assistants upstream")
+    threads: Dict[str, List[Dict[str, Any]]] = {}
+    runs: Dict[str, float] = {}
+    finished: Set[str] = set()
+    answer = " ".join(f"word{i}" for i in range(tokens))
+
+    def _id(prefix: str) -> str:
+        return f"{prefix}_{uuid.uuid4().hex[:16]}"
+
+    @app.middleware("http")
+    async def inject_errors(request: Request, call_next):
+        if error_rate and random.random() < error_rate:
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+        return await call_next(request)
+
+    @app.post("/v1/threads")
+    async def create_thread(request: Request):
+        body = await request.json() if await request.body() else {}
+        thread_id = _id("thread")
+        threads[thread_id] = list(body.get("messages") or [])
+        return {"id": thread_id, "object": "thread"}
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def add_message(thread_id: str, request: Request):
+        threads.setdefault(thread_id, []).append(await request.json())
+        return {"id": _id("msg"), "object": "thread.message"}
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        run_id = _id("run")
+        if not body.get("stream"):
+            runs[run_id] = time.monotonic() + run_seconds
+            return {"id": run_id, "object": "thread.run", "status": "queued"}
+
+        async def events():
+            message_id = _id("msg")
+            yield f"event: thread.run.created\ndata: {json.dumps({'id': run_id})}\n\n"
+            words = answer.split(" ")
+            for i, word in enumerate(words):
+                await asyncio.sleep(run_seconds / len(words))
+                delta = {"id": message_id, "delta": {"content": [
+                    {"index": 0, "type": "text", "text": {"value": word if i == 0 else " " + word}}
+                ]}}
+                yield f"event: thread.message.delta\ndata: {json.dumps(delta)}\n\n"
+            threads.setdefault(thread_id, []).append({"role": "assistant", "content": answer})
+            yield f"event: thread.run.completed\ndata: {json.dumps({'id': run_id})}\n\n"
+            yield "event: done\ndata: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def get_run(thread_id: str, run_id: str):
+        ready_at = runs.get(run_id)
+        if ready_at is None:
+            return JSONResponse({"error": {"message": "run not found"}}, status_code=404)
+        if time.monotonic() < ready_at:
+            return {"id": run_id, "status": "in_progress"}
+        if run_id not in finished:
+            finished.add(run_id)
+            threads.setdefault(thread_id, []).append({"role": "assistant", "content": answer})
+        return {"id": run_id, "status": "completed"}
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str):
+        data = [
+            {"role": m.get("role"), "content": [{"type": "text", "text": {"value": m.get("content", "")}}]}
+            for m in reversed(threads.get(thread_id, []))
+        ]
+        return {"object": "list", "data": data}
+
+    return app
@@ -0,0 +1,150 @@
+import asyncio
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100.0 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies_ms: Iterable[float]) -> Dict[str, float]:
+    values = sorted(latencies_ms)
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(values[-1], 3) if values else 0.0,
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+
+@dataclass
+class OpStats:
+    latencies_ms: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: int = 0
+
+
+class Recorder:
+    """Per-operation latencies and outcomes; samples before `start()` (warm-up) are discarded."""
+
+    def __init__(self) -> None:
+        self.ops: Dict[str, OpStats] = defaultdict(OpStats)
+        self.recording = False
+        self.started = 0.0
+        self.stopped = 0.0
+
+    def start(self) -> None:
+        self.ops.clear()
+        self.recording = True
+        self.started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.recording = False
+        self.stopped = time.perf_counter()
+
+    def record(self, op: str, elapsed_s: float, status: str, ok: bool) -> None:
+        if not self.recording:
+            return
+        stats = self.ops[op]
+        stats.latencies_ms.append(elapsed_s * 1000.0)
+        stats.statuses[status] += 1
+        if not ok:
+            stats.errors += 1
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = max(self.stopped - self.started, 1e-9)
+        total = sum(len(s.latencies_ms) for s in self.ops.values())
+        errors = sum(s.errors for s in self.ops.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 6) if total else 0.0,
+            "throughput_rps": round(total / elapsed, 2),
+            "latency_ms": latency_summary(l for s in self.ops.values() for l in s.latencies_ms),
+            "operations": {
+                op: {
+                    "requests": len(s.latencies_ms),
+                    "errors": s.errors,
+                    "error_rate": round(s.errors / len(s.latencies_ms), 6) if s.latencies_ms else 0.0,
+                    "throughput_rps": round(len(s.latencies_ms) / elapsed, 2),
+                    "latency_ms": latency_summary(s.latencies_ms),
+                    "statuses": dict(sorted(s.statuses.items())),
+                }
+                for op, s in sorted(self.ops.items())
+            },
+        }
+
+
+class Context:
+    """What scenario actions share during one run: the client, auth, target day and the recorder."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, restaurant_id: int, seed: int) -> None:
+        self.client = client
+        self.recorder = recorder
+        self.restaurant_id = restaurant_id
+        self.rng = random.Random(seed)
+        self.headers: Dict[str, str] = {}
+        # filled by scenario setup
+        self.state: Dict[str, Any] = {}
+        self._seq = 0
+
+    def next_id(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    async def call(
+        self,
+        op: str,
+        method: str,
+        url: str,
+        ok: Iterable[int] = (200,),
+        stream: bool = False,
+        **kwargs: Any,
+    ) -> Optional[httpx.Response]:
+        """Send one request and record its latency; streamed bodies are read to the end."""
+        headers = {**self.headers, **kwargs.pop("headers", {})}
+        started = time.perf_counter()
+        try:
+            if stream:
+                async with self.client.stream(method, url, headers=headers, **kwargs) as resp:
+                    async for _ in resp.aiter_raw():
+                        pass
+            else:
+                resp = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(op, time.perf_counter() - started, type(e).__name__, False)
+            return None
+        self.recorder.record(op, time.perf_counter() - started, str(resp.status_code), resp.status_code in ok)
+        return resp
+
+
+async def run_workers(ctx: Context, actions, concurrency: int, duration_s: float, warmup_s: float) -> None:
+    """Closed loop: `concurrency` workers each pick a weighted action and issue it back to back."""
+    weights = [w for w, _ in actions]
+    funcs = [f for _, f in actions]
+    deadline = time.perf_counter() + warmup_s + duration_s
+
+    async def worker(n: int) -> None:
+        rng = random.Random(ctx.rng.random() + n)
+        while time.perf_counter() < deadline:
+            await rng.choices(funcs, weights)[0](ctx)
+
+    async def clock() -> None:
+        await asyncio.sleep(warmup_s)
+        ctx.recorder.start()
+        await asyncio.sleep(duration_s)
+        ctx.recorder.stop()
+
+    await asyncio.gather(clock(), *(worker(n) for n in range(concurrency)))
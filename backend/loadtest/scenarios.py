@@ -0,0 +1,198 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .runner import Context, run_workers
+
+
+Action = Callable[[Context], Awaitable[None]]
+
+# bookings go this far ahead so they never mix with real service days
+BOOKING_HORIZON_DAYS = 400
+
+
+async def _poll_day(ctx: Context) -> None:
+    # the UI re-polls the open day with the last ETag it saw
+    day = ctx.state["days"][ctx.rng.randrange(3)]
+    etags: Dict[str, str] = ctx.state.setdefault("etags", {})
+    headers = {"If-None-Match": etags[day]} if day in etags else {}
+    resp = await ctx.call("slots_poll", "GET", f"/bookings/{ctx.restaurant_id}/{day}", ok=(200, 304), headers=headers)
+    if resp is not None and "etag" in resp.headers:
+        etags[day] = resp.headers["etag"]
+
+
+async def _get_day(ctx: Context) -> None:
+    day = ctx.rng.choice(ctx.state["days"])
+    await ctx.call("slots_day", "GET", f"/bookings/{ctx.restaurant_id}/{day}")
+
+
+async def _get_range(ctx: Context) -> None:
+    days = ctx.state["days"]
+    start = ctx.rng.randrange(len(days) - 7)
+    await ctx.call(
+        "slots_range", "GET", f"/bookings/{ctx.restaurant_id}",
+        params={"from": days[start], "to": days[start + 6]},
+    )
+
+
+async def _get_settings(ctx: Context) -> None:
+    await ctx.call("settings", "GET", f"/restaurants/{ctx.restaurant_id}/settings")
+
+
+async def _create_booking(ctx: Context) -> None:
+    # spread over the far days; a full slot answers 409, which is a valid outcome
+    day = ctx.rng.choice(ctx.state["booking_days"])
+    slot = ctx.rng.choice(ctx.state["slots"])
+    await ctx.call("booking_create", "POST", "/bookings", ok=(201, 409), json={
+        "restaurant_id": ctx.restaurant_id,
+        "date": day,
+        "time_slot": slot,
+        "client_name": f"loadtest-{ctx.state['run_id']}-{ctx.next_id()}",
+        "guest_count": ctx.rng.randint(1, 6),
+    })
+
+
+async def _assistant_chat(ctx: Context) -> None:
+    await ctx.call("assistant_chat", "POST", "/assistants/chat", json={
+        "assistant_id": "asst_loadtest",
+        "message": f"question {ctx.rng.randrange(50)}",
+        "use_cache": ctx.rng.random() < 0.5,
+    })
+
+
+async def _assistant_stream(ctx: Context) -> None:
+    await ctx.call("assistant_stream", "POST", "/assistants/chat_stream", stream=True, json={
+        "assistant_id": "asst_loadtest",
+        "message": f"question {ctx.rng.randrange(50)}",
+    })
+
+
+async def _setup_days(ctx: Context) -> None:
+    today = date.today()
+    ctx.state["days"] = [(today + timedelta(days=i)).isoformat() for i in range(14)]
+    far = today + timedelta(days=BOOKING_HORIZON_DAYS)
+    ctx.state["booking_days"] = [(far + timedelta(days=i)).isoformat() for i in range(30)]
+    resp = await ctx.client.get(f"/restaurants/{ctx.restaurant_id}/schedule", headers=ctx.headers)
+    resp.raise_for_status()
+    schedule = resp.json()
+    ctx.state["slots"] = schedule["slots"]
+    ctx.state["tables"] = schedule["table_count"]
+
+
+async def _free_slots(ctx: Context, day: str) -> List[str]:
+    resp = await ctx.client.get(f"/bookings/{ctx.restaurant_id}/{day}", headers=ctx.headers)
+    resp.raise_for_status()
+    return [s["time"] for s in resp.json()["slots"] if s["booked"] == 0]
+
+
+async def _run_bursts(ctx: Context, concurrency: int, duration_s: float, warmup_s: float) -> Dict[str, Any]:
+    """Rounds of `concurrency` simultaneous bookings on one empty slot; each round must not overbook."""
+    await _setup_days(ctx)
+    capacity = ctx.state["tables"]
+    rounds: List[Tuple[str, str, int]] = []
+    day = date.today() + timedelta(days=BOOKING_HORIZON_DAYS + 60)
+    free: List[str] = []
+
+    async def one(day_str: str, slot: str) -> bool:
+        resp = await ctx.call("booking_burst", "POST", "/bookings", ok=(201, 409), json={
+            "restaurant_id": ctx.restaurant_id,
+            "date": day_str,
+            "time_slot": slot,
+            "client_name": f"burst-{ctx.state['run_id']}-{ctx.next_id()}",
+        })
+        return resp is not None and resp.status_code == 201
+
+    async def next_target() -> Optional[Tuple[str, str]]:
+        nonlocal day, free
+        for _ in range(365):
+            if free:
+                return day.isoformat(), free.pop(0)
+            day += timedelta(days=1)
+            free = await _free_slots(ctx, day.isoformat())
+        return None
+
+    loop = asyncio.get_running_loop()
+    warm_until = loop.time() + warmup_s
+    while loop.time() < warm_until:
+        target = await next_target()
+        if target is None:
+            break
+        await asyncio.gather(*(one(*target) for _ in range(concurrency)))
+
+    ctx.recorder.start()
+    deadline = loop.time() + duration_s
+    while loop.time() < deadline:
+        target = await next_target()
+        if target is None:
+            break
+        created = await asyncio.gather(*(one(*target) for _ in range(concurrency)))
+        rounds.append((*target, sum(created)))
+    ctx.recorder.stop()
+
+    overbooked = [{"date": d, "time_slot": s, "created": n} for d, s, n in rounds if n > capacity]
+    return {
+        "rounds": len(rounds),
+        "capacity": capacity,
+        "created_per_round": sorted({n for _, _, n in rounds}),
+        "overbooked_rounds": overbooked,
+        "passed": not overbooked,
+    }
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    actions: List[Tuple[float, Action]]
+    needs_assistant: bool = False
+    # creates bookings that are never deleted, so it runs on --booking-restaurant-id
+    writes: bool = False
+    custom_run: Optional[Callable[[Context, int, float, float], Awaitable[Dict[str, Any]]]] = None
+
+    async def run(self, ctx: Context, concurrency: int, duration_s: float, warmup_s: float) -> Dict[str, Any]:
+        """Drive the scenario; returns its correctness checks (latencies go to ctx.recorder)."""
+        if self.custom_run is not None:
+            return await self.custom_run(ctx, concurrency, duration_s, warmup_s)
+        await _setup_days(ctx)
+        await run_workers(ctx, self.actions, concurrency, duration_s, warmup_s)
+        return {}
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    s.name: s
+    for s in (
+        Scenario(
+            "read_heavy",
+            "Front desks polling slots: conditional day polls, cold days, 7-day ranges, settings",
+            [(0.6, _poll_day), (0.2, _get_day), (0.15, _get_range), (0.05, _get_settings)],
+        ),
+        Scenario(
+            "booking_burst",
+            "All workers book the same empty slot at once, round after round; checks nothing is overbooked",
+            [],
+            writes=True,
+            custom_run=_run_bursts,
+        ),
+        Scenario(
+            "booking_writes",
+            "Only booking creations on spread-out days; compare with BOOKING_GROUP_COMMIT off and on",
+            [(1.0, _create_booking)],
+            writes=True,
+        ),
+        Scenario(
+            "mixed",
+            "Slot reads, bookings, settings and assistant chat (plain and streamed) against the mock upstream",
+            [
+                (0.5, _poll_day),
+                (0.1, _get_range),
+                (0.1, _create_booking),
+                (0.1, _get_settings),
+                (0.15, _assistant_chat),
+                (0.05, _assistant_stream),
+            ],
+            needs_assistant=True,
+            writes=True,
+        ),
+    )
+}